@@ -1,18 +1,24 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, Form, Response, UploadFile, File
+from fastapi import FastAPI, Request, HTTPException, Depends, Form, Response, UploadFile, File, Header
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, FileResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, conint
+from typing import Optional
 import json
 import os
 import asyncio
+import time
 from price_calculator import PriceCalculator
+from step_registry import RunTimings
+from deadline import DeadlineExceeded
+from browser_pool import browser_pool, MemoryPressureError
 from sse_starlette.sse import EventSourceResponse
 from sqlalchemy.orm import Session
 from database import get_db, init_db
 import crud, schemas
 from datetime import datetime
 from config_manager import export_configs_to_file, import_configs_from_file
+from config import SWEEP_MAX_PARALLEL
 import tempfile
 from urllib.parse import unquote
 
@@ -33,7 +39,16 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 # Initialize calculator
-calculator = PriceCalculator()
+calculator = PriceCalculator(browser_pool)
+
+@app.on_event("startup")
+async def start_calculator():
+    # Launch the shared browsers once instead of per calculation
+    await calculator.start()
+
+@app.on_event("shutdown")
+async def stop_calculator():
+    await calculator.stop()
 
 class SquareMeterPriceRequest(BaseModel):
     url: str
@@ -41,12 +56,26 @@ class SquareMeterPriceRequest(BaseModel):
     lengte: float
     breedte: float
     country: str = 'nl'
+    learn: bool = False  # Store the request that returns the price, so later calculations skip the browser
+    timeout_ms: Optional[int] = None  # Time budget of the calculation, CALCULATION_TIMEOUT_MS when not set
+
+class SweepDimensions(BaseModel):
+    dikte: float
+    lengte: float
+    breedte: float
+
+class SweepRequest(BaseModel):
+    url: str
+    dimensions: list[SweepDimensions]
+    country: str = 'nl'
+    parallel: conint(ge=1, le=SWEEP_MAX_PARALLEL) = 1  # Above 1, run the shared steps once and the rest in this many parallel contexts
 
 class ShippingRequest(BaseModel):
     url: str
     country: str = 'nl'
     package_type: int = 1  # 1-6 for different package sizes
     thickness: float = None  # Optional override for package thickness
+    timeout_ms: Optional[int] = None  # Time budget of the calculation, CALCULATION_TIMEOUT_MS when not set
 
 class ConfigRequest(BaseModel):
     domain: str
@@ -118,8 +147,35 @@ async def config_page(request: Request, db: Session = Depends(get_db)):
         "package_configs": package_configs
     })
 
+def _time_budget(timeout_ms: Optional[int], x_deadline: Optional[float]) -> Optional[float]:
+    """Time budget in ms from a request's timeout_ms and its X-Deadline header (Unix time in seconds)"""
+    budgets = []
+    if timeout_ms is not None:
+        budgets.append(float(timeout_ms))
+    if x_deadline is not None:
+        budgets.append((x_deadline - time.time()) * 1000)
+    if not budgets:
+        return None
+    budget = min(budgets)
+    if budget <= 0:
+        raise DeadlineExceeded(budget, "admission of the request")
+    return budget
+
+def _deadline_response(e: DeadlineExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=504,
+        detail={
+            "status": "error",
+            "status_code": 504,
+            "message": str(e),
+            "error_type": "DeadlineExceeded",
+            "activity": e.activity
+        }
+    )
+
 @app.post("/api/calculate-smp")
-async def calculate_square_meter_price(request: SquareMeterPriceRequest, db: Session = Depends(get_db)):
+async def calculate_square_meter_price(request: SquareMeterPriceRequest, db: Session = Depends(get_db),
+                                       x_deadline: Optional[float] = Header(None)):
     try:
         dimensions = {
             'thickness': request.dikte,
@@ -127,11 +183,15 @@ async def calculate_square_meter_price(request: SquareMeterPriceRequest, db: Ses
             'width': request.breedte
         }
         
+        timings = RunTimings()
         price_excl_vat, price_incl_vat = await calculator.calculate_price(
             request.url, 
             dimensions, 
             country=request.country,
-            category='square_meter_price'
+            category='square_meter_price',
+            learn=request.learn,
+            timings=timings,
+            timeout_ms=_time_budget(request.timeout_ms, x_deadline)
         )
         
         country_config = crud.get_country_config(db, request.country)
@@ -148,7 +208,8 @@ async def calculate_square_meter_price(request: SquareMeterPriceRequest, db: Ses
                 "price_incl_vat": round(price_incl_vat, 2),
                 "currency": country_info['currency'],
                 "currency_symbol": country_info['currency_symbol'],
-                "vat_rate": country_info['vat_rate']
+                "vat_rate": country_info['vat_rate'],
+                "timings": timings.as_dict()
             }
         }
     except ValueError as e:
@@ -161,6 +222,19 @@ async def calculate_square_meter_price(request: SquareMeterPriceRequest, db: Ses
                 "error_type": "ValueError"
             }
         )
+    except MemoryPressureError as e:
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "status": "error",
+                "status_code": 503,
+                "message": str(e),
+                "error_type": "MemoryPressureError"
+            },
+            headers={"Retry-After": "30"}
+        )
+    except DeadlineExceeded as e:
+        raise _deadline_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -172,8 +246,77 @@ async def calculate_square_meter_price(request: SquareMeterPriceRequest, db: Ses
             }
         )
 
+def _error_response(status_code: int, e: Exception, headers: dict = None) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail={
+            "status": "error",
+            "status_code": status_code,
+            "message": str(e),
+            "error_type": type(e).__name__
+        },
+        headers=headers
+    )
+
+@app.post("/api/sweep-smp")
+async def sweep_square_meter_prices(request: SweepRequest, db: Session = Depends(get_db)):
+    """Stream the square meter prices of many dimension sets as JSON lines, all read on one page"""
+    if not request.dimensions:
+        raise _error_response(400, ValueError("No dimension sets given"))
+
+    country_config = crud.get_country_config(db, request.country)
+    if not country_config:
+        country_config = crud.get_country_config(db, 'nl')  # Fallback to NL
+    country_info = country_config.config
+
+    dimension_sets = [
+        {'thickness': d.dikte, 'length': d.lengte, 'width': d.breedte}
+        for d in request.dimensions
+    ]
+    if request.parallel > 1:
+        results = calculator.fork_prices(request.url, dimension_sets, country=request.country,
+                                         category='square_meter_price', parallel=request.parallel)
+    else:
+        results = calculator.sweep_prices(request.url, dimension_sets, country=request.country, category='square_meter_price')
+
+    # Errors before the first price, such as a missing configuration, get a status code
+    try:
+        first = await results.__anext__()
+    except ValueError as e:
+        raise _error_response(400, e)
+    except MemoryPressureError as e:
+        raise _error_response(503, e, headers={"Retry-After": "30"})
+    except Exception as e:
+        raise _error_response(500, e)
+
+    def line(result: dict) -> str:
+        index = result['index']
+        dimensions = request.dimensions[index]
+        data = {"index": index, "dikte": dimensions.dikte, "lengte": dimensions.lengte, "breedte": dimensions.breedte}
+        if 'error' in result:
+            return json.dumps({"status": "error", "message": result['error'], "data": data}) + "\n"
+        data.update({
+            "price_excl_vat": round(result['price_excl_vat'], 2),
+            "price_incl_vat": round(result['price_incl_vat'], 2),
+            "currency": country_info['currency'],
+            "currency_symbol": country_info['currency_symbol'],
+            "vat_rate": country_info['vat_rate']
+        })
+        return json.dumps({"status": "success", "data": data}) + "\n"
+
+    async def stream():
+        yield line(first)
+        try:
+            async for result in results:
+                yield line(result)
+        except Exception as e:
+            yield json.dumps({"status": "error", "message": str(e), "error_type": type(e).__name__}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.post("/api/calculate-shipping")
-async def calculate_shipping(request: ShippingRequest, db: Session = Depends(get_db)):
+async def calculate_shipping(request: ShippingRequest, db: Session = Depends(get_db),
+                             x_deadline: Optional[float] = Header(None)):
     """Calculate shipping costs"""
     try:
         package_id = str(request.package_type)
@@ -190,11 +333,14 @@ async def calculate_shipping(request: ShippingRequest, db: Session = Depends(get
             'quantity': package['quantity']
         }
         
+        timings = RunTimings()
         price_excl_vat, price_incl_vat = await calculator.calculate_price(
             request.url, 
             dimensions, 
             country=request.country,
-            category='shipping'
+            category='shipping',
+            timings=timings,
+            timeout_ms=_time_budget(request.timeout_ms, x_deadline)
         )
         
         country_config = crud.get_country_config(db, request.country)
@@ -220,7 +366,8 @@ async def calculate_shipping(request: ShippingRequest, db: Session = Depends(get
                     "dimensions": f"{package['length']}x{package['width']} mm",
                     "thickness": dimensions['thickness'],  # Use the actual thickness being used
                     "display": package['display']
-                }
+                },
+                "timings": timings.as_dict()
             }
         }
     except ValueError as e:
@@ -233,6 +380,19 @@ async def calculate_shipping(request: ShippingRequest, db: Session = Depends(get
                 "error_type": "ValueError"
             }
         )
+    except MemoryPressureError as e:
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "status": "error",
+                "status_code": 503,
+                "message": str(e),
+                "error_type": "MemoryPressureError"
+            },
+            headers={"Retry-After": "30"}
+        )
+    except DeadlineExceeded as e:
+        raise _deadline_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -244,6 +404,45 @@ async def calculate_shipping(request: ShippingRequest, db: Session = Depends(get
             }
         )
 
+@app.get("/api/browser-pool")
+async def get_browser_pool_stats():
+    """Get statistics of the shared browser pool"""
+    if browser_pool.started:
+        await browser_pool.sample_memory()
+    return browser_pool.get_stats()
+
+@app.get("/api/warm-pool")
+async def get_warm_pool_stats():
+    """Get statistics of the pre-loaded page pool"""
+    return calculator.warm_pool.get_stats()
+
+@app.get("/api/network-stats")
+async def get_network_stats():
+    """Get network usage and blocked requests per domain"""
+    return calculator.network_monitor.get_stats()
+
+@app.get("/api/asset-cache")
+async def get_asset_cache_stats():
+    """Get size and hit/miss counters of the shared asset cache"""
+    if not calculator.asset_cache:
+        return {"enabled": False}
+    return calculator.asset_cache.get_stats()
+
+@app.get("/api/input-strategies")
+async def get_input_strategies():
+    """Get the input strategy that worked per domain and selector"""
+    return calculator.input_strategies.get_stats()
+
+@app.get("/api/selector-stats")
+async def get_selector_stats():
+    """Get hits and misses of the candidate selectors of steps with a fallback chain"""
+    return calculator.selector_stats.get_stats()
+
+@app.get("/api/price-endpoints")
+async def get_price_endpoint_stats():
+    """Get counters of learned and replayed price requests"""
+    return calculator.endpoint_reader.get_stats()
+
 @app.get("/api/config/{domain}")
 async def get_config(domain: str, db: Session = Depends(get_db)):
     # URL decode the domain
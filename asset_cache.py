@@ -0,0 +1,271 @@
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from config import ASSET_CACHE_DIR, ASSET_CACHE_MAX_MB
+
+# Only static assets are served from disk
+CACHEABLE_RESOURCE_TYPES = ('script', 'stylesheet')
+
+# Headers that describe the transfer instead of the content
+SKIPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie', 'date', 'age')
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into a dict of directives"""
+    directives = {}
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, argument = part.partition('=')
+        directives[name.strip().lower()] = argument.strip().strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: Dict[str, str]) -> int:
+    """Seconds a response may be served from a shared cache, 0 if it may not be stored.
+
+    Follows the shared cache rules of Cache-Control: no-store, no-cache and private
+    responses are not stored, s-maxage takes precedence over max-age, and responses
+    without explicit freshness information are not cached.
+    """
+    if 'set-cookie' in headers:
+        return 0
+    vary = headers.get('vary', '').lower()
+    if vary and any(v.strip() not in ('accept-encoding', 'origin') for v in vary.split(',')):
+        return 0
+
+    directives = parse_cache_control(headers.get('cache-control', ''))
+    if any(d in directives for d in ('no-store', 'no-cache', 'private')):
+        return 0
+
+    lifetime = None
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name) and directives[name].isdigit():
+            lifetime = int(directives[name])
+            break
+
+    if lifetime is None and headers.get('expires'):
+        try:
+            lifetime = int(parsedate_to_datetime(headers['expires']).timestamp() - time.time())
+        except (TypeError, ValueError):
+            lifetime = 0
+
+    if lifetime is None:
+        return 0
+
+    age = headers.get('age', '0')
+    return max(0, lifetime - (int(age) if age.isdigit() else 0))
+
+
+class AssetCache:
+    """Content-addressed disk cache for static scripts and stylesheets.
+
+    The cache sits behind Playwright route interception and is shared by all runs, so
+    fresh contexts do not download the same bundles of a shop again. Bodies are stored
+    by their SHA-256 hash, entries are evicted least recently used first when the cache
+    grows beyond its size limit, and hits and misses are counted per domain.
+    """
+
+    def __init__(self, directory: str = ASSET_CACHE_DIR, max_bytes: int = ASSET_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._blob_refs: Dict[str, int] = {}
+        self._blob_sizes: Dict[str, int] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._loaded = False
+        self._dirty = 0
+
+    @property
+    def size(self) -> int:
+        return sum(self._blob_sizes.values())
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, 'index.json')
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _load(self):
+        """Load the index from disk and remove blobs that are no longer referenced"""
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self._index_path()) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+
+        now = time.time()
+        for url, entry in sorted(entries.items(), key=lambda item: item[1].get('last_used', 0)):
+            if entry['expires'] > now and os.path.exists(self._blob_path(entry['sha'])):
+                self._add_entry(url, entry)
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name != 'index.json' and name not in self._blob_refs:
+                    os.remove(os.path.join(root, name))
+
+    async def load(self):
+        """Load the index in a worker thread, call this at startup so the first route does not block the event loop"""
+        if not self._loaded:
+            await asyncio.to_thread(self._load)
+
+    def save(self):
+        """Write the index to disk"""
+        if not self._loaded:
+            return
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self._index_path())
+        self._dirty = 0
+
+    def _mark_dirty(self):
+        self._dirty += 1
+        if self._dirty >= 20:
+            self.save()
+
+    def _add_entry(self, url: str, entry: Dict[str, Any]):
+        self._entries[url] = entry
+        self._blob_refs[entry['sha']] = self._blob_refs.get(entry['sha'], 0) + 1
+        self._blob_sizes[entry['sha']] = entry['size']
+
+    def _release_blob(self, digest: str):
+        self._blob_refs[digest] -= 1
+        if self._blob_refs[digest] == 0:
+            del self._blob_refs[digest]
+            del self._blob_sizes[digest]
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+
+    def _remove_entry(self, url: str):
+        # Eviction or another route may have removed the entry already
+        entry = self._entries.pop(url, None)
+        if entry is None:
+            return
+        self._release_blob(entry['sha'])
+        self._mark_dirty()
+
+    def _evict(self):
+        while self._entries and self.size > self.max_bytes:
+            url = next(iter(self._entries))
+            logging.info(f"Evicting {url} from asset cache")
+            self._remove_entry(url)
+
+    def _count(self, domain: str, counter: str):
+        counters = self._counters.setdefault(domain, {"hits": 0, "misses": 0, "stored": 0, "bytes_served": 0})
+        counters[counter] += 1
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the fresh entry for a URL, if any, and mark it as recently used"""
+        if not self._loaded:
+            self._load()
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.time():
+            self._remove_entry(url)
+            return None
+        self._entries.move_to_end(url)
+        entry['last_used'] = time.time()
+        return entry
+
+    async def read(self, entry: Dict[str, Any]) -> bytes:
+        def _read():
+            with open(self._blob_path(entry['sha']), 'rb') as f:
+                return f.read()
+        return await asyncio.to_thread(_read)
+
+    async def store(self, url: str, status: int, headers: Dict[str, str], body: bytes, lifetime: int):
+        """Store a response body under its content hash"""
+        if not self._loaded:
+            self._load()
+        if len(body) > self.max_bytes:
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+
+        def _write():
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(body)
+        await asyncio.to_thread(_write)
+
+        now = time.time()
+        previous = self._entries.pop(url, None)
+        self._add_entry(url, {
+            "sha": digest,
+            "size": len(body),
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in SKIPPED_HEADERS},
+            "expires": now + lifetime,
+            "last_used": now
+        })
+        if previous:
+            # Release after adding, so a body that did not change is kept on disk
+            self._release_blob(previous['sha'])
+        self._mark_dirty()
+        self._evict()
+
+    async def install(self, context, domain: str):
+        """Serve cacheable scripts and stylesheets of a context from the cache"""
+        async def handle_route(route):
+            request = route.request
+            if request.method != 'GET' or request.resource_type not in CACHEABLE_RESOURCE_TYPES:
+                await route.fallback()
+                return
+
+            entry = self.lookup(request.url)
+            if entry:
+                try:
+                    body = await self.read(entry)
+                except OSError:
+                    self._remove_entry(request.url)
+                else:
+                    self._count(domain, "hits")
+                    self._counters[domain]["bytes_served"] += len(body)
+                    await route.fulfill(status=entry['status'], headers=entry['headers'], body=body)
+                    return
+
+            self._count(domain, "misses")
+            try:
+                response = await route.fetch()
+                body = await response.body()
+            except Exception as e:
+                logging.warning(f"Asset cache could not fetch {request.url}: {str(e)}")
+                await route.fallback()
+                return
+
+            headers = {k.lower(): v for k, v in response.headers.items()}
+            lifetime = freshness_lifetime(headers) if response.status == 200 else 0
+            if lifetime > 0:
+                await self.store(request.url, response.status, headers, body, lifetime)
+                self._count(domain, "stored")
+
+            await route.fulfill(response=response, body=body)
+
+        await context.route(re.compile(r'^https?://'), handle_route)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters per domain"""
+        if not self._loaded:
+            self._load()
+        return {
+            "directory": self.directory,
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "domains": {domain: dict(counters) for domain, counters in self._counters.items()}
+        }
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import copy
+import json
+import statistics
+import time
+from database import SessionLocal
+import crud
+import schemas
+from price_calculator import PriceCalculator
+from browser_profile import candidate_profiles
+
+
+def _benchmark_config(domain_config, profile):
+    """Copy of a domain config that uses `profile` and starts every run from scratch"""
+    config = copy.deepcopy(domain_config)
+    config['browser'] = {k: v for k, v in profile.items() if k != 'name'}
+    config['warm_pool'] = {'enabled': False}
+    for category_config in config['categories'].values():
+        category_config['storage_state'] = {'enabled': False}
+    return config
+
+
+async def _timed_run(calculator, url, config, category, dimensions, country_info):
+    start = time.perf_counter()
+    price_excl, _ = await calculator.calculate_price_with_config(url, config, dimensions, country_info, category)
+    return time.perf_counter() - start, price_excl
+
+
+async def benchmark(url, category, dimensions, country, runs, expected=None, tolerance=0.01, profiles=None):
+    """Run the steps of a domain under each profile.
+
+    Returns the domain and the results, fastest correct profile first.
+    """
+    calculator = PriceCalculator()
+    domain = calculator._normalize_domain(url)
+
+    db = SessionLocal()
+    try:
+        config = crud.get_domain_config(db, domain)
+        if not config:
+            raise ValueError(f"No configuration found for domain: {domain}")
+        domain_config = config.config
+        country_config = crud.get_country_config(db, country) or crud.get_country_config(db, 'nl')
+        country_info = country_config.config
+    finally:
+        db.close()
+
+    if category not in domain_config['categories']:
+        raise ValueError(f"Category '{category}' not supported for domain: {domain}")
+
+    await calculator.browser_pool.start()
+    try:
+        # The first run fills the asset cache and gives the reference price
+        print("Reference run with the current configuration...")
+        reference_config = _benchmark_config(domain_config, domain_config.get('browser') or {})
+        _, reference_price = await _timed_run(calculator, url, reference_config, category, dimensions, country_info)
+        if expected is None:
+            expected = reference_price
+        print(f"Expected price excl. VAT: {expected:.2f}")
+
+        results = []
+        for profile in profiles or candidate_profiles():
+            name = profile.get('name', json.dumps(profile))
+            config = _benchmark_config(domain_config, profile)
+            durations = []
+            prices = []
+            error = None
+            for _ in range(runs):
+                try:
+                    duration, price = await _timed_run(calculator, url, config, category, dimensions, country_info)
+                except Exception as e:
+                    error = str(e)
+                    break
+                durations.append(duration)
+                prices.append(price)
+
+            correct = error is None and all(abs(price - expected) <= tolerance for price in prices)
+            result = {
+                "name": name,
+                "profile": profile,
+                "median_seconds": statistics.median(durations) if durations else None,
+                "prices": prices,
+                "correct": correct,
+                "error": error
+            }
+            results.append(result)
+            if error:
+                print(f"  {name:<20} failed: {error}")
+            else:
+                status = "ok" if correct else "wrong price"
+                print(f"  {name:<20} {result['median_seconds']:.2f}s  {status}")
+    finally:
+        await calculator.stop()
+
+    return domain, sorted(results, key=lambda r: (not r['correct'], r['median_seconds'] or float('inf')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the fastest browser profile for a domain')
+    parser.add_argument('url', help='Product URL of the domain to benchmark')
+    parser.add_argument('--category', default='square_meter_price', help='Category whose steps are run')
+    parser.add_argument('--country', default='nl', help='Country for the VAT rate')
+    parser.add_argument('--thickness', type=float, default=3, help='Thickness in mm')
+    parser.add_argument('--length', type=float, default=1000, help='Length in mm')
+    parser.add_argument('--width', type=float, default=500, help='Width in mm')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per profile, the median duration is compared')
+    parser.add_argument('--expected', type=float, help='Expected price excl. VAT, defaults to the price of the current configuration')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Allowed difference from the expected price')
+    parser.add_argument('--profiles', help='JSON file with a list of profiles to try instead of the built-in candidates')
+    parser.add_argument('--save', action='store_true', help='Store the fastest correct profile in the domain configuration')
+
+    args = parser.parse_args()
+
+    profiles = None
+    if args.profiles:
+        with open(args.profiles) as f:
+            profiles = json.load(f)
+
+    dimensions = {'thickness': args.thickness, 'length': args.length, 'width': args.width}
+    domain, results = asyncio.run(benchmark(
+        args.url, args.category, dimensions, args.country, max(1, args.runs),
+        expected=args.expected, tolerance=args.tolerance, profiles=profiles
+    ))
+
+    fastest = results[0] if results and results[0]['correct'] else None
+    if not fastest:
+        print("No profile returned the expected price")
+        return
+    print(f"Fastest correct profile: {fastest['name']} ({fastest['median_seconds']:.2f}s)")
+
+    if args.save:
+        db = SessionLocal()
+        try:
+            config = crud.get_domain_config(db, domain)
+            domain_config = copy.deepcopy(config.config)
+            domain_config['browser'] = fastest['profile']
+            crud.create_domain_config(db, schemas.DomainConfigCreate(domain=domain, config=domain_config))
+            print(f"Saved profile '{fastest['name']}' for {domain}")
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
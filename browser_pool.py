@@ -0,0 +1,433 @@
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
+from contextlib import asynccontextmanager
+from collections import deque
+from datetime import datetime
+import asyncio
+import json
+import logging
+import time
+import process_memory
+from config import (
+    HEADLESS, BROWSER_POOL_SIZE, BROWSER_MAX_RUNS, BROWSER_MEMORY_LIMIT_MB,
+    MEMORY_WATERMARK_MB, MEMORY_ADMISSION_TIMEOUT, BROWSER_ENDPOINTS, BROWSER_CONNECT_TIMEOUT,
+    BROWSER_RECONNECT_INTERVAL
+)
+
+MB = 1024 * 1024
+
+# Seconds a memory sample is reused before /proc is scanned again
+MEMORY_SAMPLE_INTERVAL = 0.5
+
+
+class MemoryPressureError(RuntimeError):
+    """Raised when a run cannot be admitted because memory stays above the watermark"""
+
+
+class PooledBrowser:
+    """A single browser owned by the pool, either a local process or a remote worker"""
+
+    def __init__(self, index: int, browser: Browser, generation: int, marker: Optional[str],
+                 endpoint: Optional[str] = None, fallback: bool = False, key: Tuple = None):
+        self.index = index
+        self.browser = browser
+        self.generation = generation
+        self.marker = marker
+        self.endpoint = endpoint
+        self.fallback = fallback
+        self.key = key  # (engine, launch args) for browsers outside the default slots
+        self.runs = 0
+        self.active = 0
+        self.retired = False
+        self.started_at = datetime.now()
+        self.rss = None
+
+    def is_connected(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "generation": self.generation,
+            "engine": self.key[0] if self.key else "chromium",
+            "launch_args": list(self.key[1]) if self.key else [],
+            "endpoint": self.endpoint,
+            "remote": self.endpoint is not None and not self.fallback,
+            "fallback": self.fallback,
+            "runs": self.runs,
+            "active_contexts": self.active,
+            "connected": self.is_connected(),
+            "retired": self.retired,
+            "started_at": self.started_at.isoformat(),
+            "rss_bytes": self.rss
+        }
+
+
+class BrowserPool:
+    """Keeps a fixed number of long-lived browsers and hands out a fresh context per run.
+
+    Browsers are started once (on app startup or on first use) and restarted in the
+    background after `max_runs` runs or when their memory grows beyond
+    `memory_limit_mb`, so a single browser never accumulates state or memory forever.
+    Every run still gets its own isolated BrowserContext. New runs are queued while the
+    memory of the whole application is above `memory_watermark_mb`.
+
+    When `endpoints` are given, every slot connects to one Playwright browser server
+    instead of launching Chromium in this process. A slot whose server cannot be reached
+    launches a local browser and tries its server again after `reconnect_interval`.
+
+    Runs that need another engine or other launch flags get a separate browser per
+    combination, started on first use and restarted under the same rules.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_runs: int = BROWSER_MAX_RUNS, headless: bool = HEADLESS,
+                 memory_limit_mb: int = BROWSER_MEMORY_LIMIT_MB, memory_watermark_mb: int = MEMORY_WATERMARK_MB,
+                 admission_timeout: float = MEMORY_ADMISSION_TIMEOUT, endpoints: List[str] = None,
+                 connect_timeout: float = BROWSER_CONNECT_TIMEOUT, reconnect_interval: float = BROWSER_RECONNECT_INTERVAL):
+        self.endpoints = list(BROWSER_ENDPOINTS if endpoints is None else endpoints)
+        self.size = len(self.endpoints) if self.endpoints else max(1, size)
+        self.max_runs = max(1, max_runs)
+        self.headless = headless
+        self.memory_limit = memory_limit_mb * MB if memory_limit_mb else None
+        self.memory_watermark = memory_watermark_mb * MB if memory_watermark_mb else None
+        self.admission_timeout = admission_timeout
+        self.connect_timeout = connect_timeout
+        self.reconnect_interval = reconnect_interval
+        self._playwright = None
+        self._slots: List[Optional[PooledBrowser]] = []
+        self._draining: List[PooledBrowser] = []
+        self._extra: Dict[Tuple, PooledBrowser] = {}
+        self._extra_indexes: Dict[Tuple, int] = {}
+        self._owners: Dict[BrowserContext, PooledBrowser] = {}
+        self._lock = asyncio.Lock()
+        self._recycling = set()
+        self._launches = 0
+        self._restarts = 0
+        self._memory_restarts = 0
+        self._fallbacks = 0
+        self._total_runs = 0
+        self._failed_runs = 0
+        self._queued = 0
+        self._refused = 0
+        self._recent_runs = deque(maxlen=50)
+        self._memory_sample: Optional[asyncio.Future] = None
+        self._memory_sampled_at = 0.0
+        self._total_rss = None
+
+    @property
+    def started(self) -> bool:
+        return self._playwright is not None
+
+    async def start(self):
+        """Start Playwright and launch all browsers of the pool"""
+        async with self._lock:
+            if self._playwright is not None:
+                return
+            if self.endpoints:
+                logging.info(f"Starting browser pool with {self.size} remote browser(s)")
+            else:
+                logging.info(f"Starting browser pool with {self.size} browser(s)")
+            self._playwright = await async_playwright().start()
+            self._slots = [None] * self.size
+            results = await asyncio.gather(
+                *(self._launch(index) for index in range(self.size)),
+                return_exceptions=True
+            )
+            for index, result in enumerate(results):
+                if isinstance(result, Exception):
+                    logging.error(f"Could not launch browser {index}: {str(result)}")
+                else:
+                    self._slots[index] = result
+
+    async def stop(self):
+        """Close all browsers and stop Playwright"""
+        async with self._lock:
+            if self._playwright is None:
+                return
+            logging.info("Stopping browser pool")
+            for pooled in self._browsers():
+                await self._close(pooled)
+            self._slots = []
+            self._draining = []
+            self._extra = {}
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _launch(self, index: int) -> PooledBrowser:
+        previous = self._slots[index] if index < len(self._slots) else None
+        generation = previous.generation + 1 if previous else 1
+        endpoint = self.endpoints[index] if self.endpoints else None
+        return await self._start_browser(index, generation, endpoint)
+
+    async def _launch_extra(self, key: Tuple) -> PooledBrowser:
+        if key not in self._extra_indexes:
+            self._extra_indexes[key] = self.size + len(self._extra_indexes)
+        index = self._extra_indexes[key]
+        previous = self._extra.get(key)
+        generation = previous.generation + 1 if previous else 1
+        endpoint = self.endpoints[index % len(self.endpoints)] if self.endpoints else None
+        return await self._start_browser(index, generation, endpoint, key)
+
+    async def _start_browser(self, index: int, generation: int, endpoint: Optional[str], key: Tuple = None) -> PooledBrowser:
+        engine, args = key or ('chromium', ())
+        browser_type = getattr(self._playwright, engine)
+
+        if endpoint:
+            try:
+                # The browser server launches the browser with the options of this header
+                launch_options = json.dumps({"headless": self.headless, "args": list(args)})
+                browser = await browser_type.connect(
+                    endpoint,
+                    timeout=self.connect_timeout * 1000,
+                    headers={"x-playwright-launch-options": launch_options}
+                )
+                self._launches += 1
+                logging.info(f"Connected pooled {engine} browser {index} to {endpoint} (generation {generation})")
+                return PooledBrowser(index, browser, generation, None, endpoint, key=key)
+            except Exception as e:
+                self._fallbacks += 1
+                logging.warning(f"Could not connect to browser server {endpoint}, launching locally: {str(e)}")
+
+        marker = None
+        launch_args = list(args)
+        if engine == 'chromium':
+            # Unknown switches are ignored by Chromium, this one lets us find the process in /proc
+            marker = f"--price-watcher-browser={index}.{generation}"
+            launch_args.append(marker)
+        browser = await browser_type.launch(headless=self.headless, args=launch_args)
+        self._launches += 1
+        logging.info(f"Launched pooled {engine} browser {index} (generation {generation})")
+        return PooledBrowser(index, browser, generation, marker, endpoint, fallback=endpoint is not None, key=key)
+
+    async def _close(self, pooled: PooledBrowser):
+        try:
+            if pooled.is_connected():
+                await pooled.browser.close()
+        except Exception as e:
+            logging.warning(f"Error closing pooled browser {pooled.index}: {str(e)}")
+
+    def _browsers(self) -> List[PooledBrowser]:
+        return [slot for slot in self._slots if slot] + list(self._extra.values()) + self._draining
+
+    @staticmethod
+    def _scan_memory(markers: List[str]) -> Tuple[Dict[str, int], Optional[int]]:
+        return process_memory.rss_by_marker(markers), process_memory.tree_rss()
+
+    async def _update_memory(self) -> Optional[int]:
+        """Refresh the RSS of every browser and return the RSS of the whole application"""
+        browsers = self._browsers()
+        # Reading /proc takes a while with many processes, keep it off the event loop
+        usage, total = await asyncio.to_thread(self._scan_memory, [b.marker for b in browsers if b.marker])
+        for pooled in browsers:
+            pooled.rss = usage.get(pooled.marker)
+        self._total_rss = total
+        return total
+
+    async def sample_memory(self) -> Optional[int]:
+        """The RSS of the whole application, scanned at most every `MEMORY_SAMPLE_INTERVAL` seconds.
+
+        Runs that are admitted or released at the same time share one scan.
+        """
+        if self._memory_sample is None or time.monotonic() - self._memory_sampled_at >= MEMORY_SAMPLE_INTERVAL:
+            self._memory_sample = asyncio.ensure_future(self._update_memory())
+            self._memory_sampled_at = time.monotonic()
+        # A waiter that is cancelled must not cancel the scan the others wait for
+        return await asyncio.shield(self._memory_sample)
+
+    async def _admit(self):
+        """Wait until memory is below the watermark, or refuse the run after the timeout"""
+        if not self.memory_watermark:
+            return
+        deadline = time.monotonic() + self.admission_timeout
+        queued = False
+        try:
+            while True:
+                total = await self.sample_memory()
+                active = sum(b.active for b in self._browsers())
+                # Never block when nothing is running, memory cannot go down by waiting
+                if total is None or total < self.memory_watermark or active == 0:
+                    return
+                if time.monotonic() >= deadline:
+                    self._refused += 1
+                    raise MemoryPressureError(
+                        f"Memory usage {total // MB} MB is above the watermark of {self.memory_watermark // MB} MB, "
+                        f"try again later"
+                    )
+                if not queued:
+                    queued = True
+                    self._queued += 1
+                    logging.warning(f"Memory usage {total // MB} MB above watermark, queueing run")
+                await asyncio.sleep(0.5)
+        finally:
+            if queued:
+                self._queued -= 1
+
+    async def _acquire(self, key: Tuple = None) -> PooledBrowser:
+        if self._playwright is None:
+            await self.start()
+
+        await self._admit()
+
+        async with self._lock:
+            if key is not None:
+                pooled = self._extra.get(key)
+                if pooled is None or not pooled.is_connected():
+                    if pooled is not None:
+                        logging.warning(f"Pooled {key[0]} browser {pooled.index} is disconnected, relaunching")
+                        self._restarts += 1
+                    pooled = self._extra[key] = await self._launch_extra(key)
+                pooled.active += 1
+                pooled.runs += 1
+                self._total_runs += 1
+                return pooled
+
+            # Replace browsers that crashed or never launched before handing one out
+            for index, pooled in enumerate(self._slots):
+                if pooled is None or not pooled.is_connected():
+                    if pooled is not None:
+                        logging.warning(f"Pooled browser {index} is disconnected, relaunching")
+                        self._restarts += 1
+                    self._slots[index] = await self._launch(index)
+
+            # Least busy browser first, fewest runs as tie breaker
+            pooled = min(self._slots, key=lambda b: (b.active, b.runs))
+            pooled.active += 1
+            pooled.runs += 1
+            self._total_runs += 1
+            return pooled
+
+    async def _release(self, pooled: PooledBrowser):
+        pooled.active -= 1
+        if pooled.retired:
+            if pooled.active == 0 and pooled in self._draining:
+                self._draining.remove(pooled)
+                await self._close(pooled)
+            return
+
+        if pooled.index in self._recycling:
+            return
+        if self.memory_limit and pooled.marker:
+            await self.sample_memory()
+        if pooled.runs >= self.max_runs:
+            reason = f"after {pooled.runs} runs"
+        elif self.memory_limit and pooled.rss and pooled.rss > self.memory_limit:
+            reason = f"at {pooled.rss // MB} MB"
+            self._memory_restarts += 1
+        elif pooled.fallback and (datetime.now() - pooled.started_at).total_seconds() >= self.reconnect_interval:
+            reason = f"to reconnect to {pooled.endpoint}"
+        else:
+            return
+        self._recycling.add(pooled.index)
+        asyncio.create_task(self._recycle(pooled, reason))
+
+    async def _recycle(self, pooled: PooledBrowser, reason: str):
+        """Launch a replacement browser and let the old one drain its running contexts"""
+        try:
+            async with self._lock:
+                if pooled.key is not None:
+                    if self._playwright is None or self._extra.get(pooled.key) is not pooled:
+                        return
+                    self._extra[pooled.key] = await self._launch_extra(pooled.key)
+                else:
+                    if self._playwright is None or self._slots[pooled.index] is not pooled:
+                        return
+                    self._slots[pooled.index] = await self._launch(pooled.index)
+                self._restarts += 1
+                pooled.retired = True
+                logging.info(f"Recycled pooled browser {pooled.index} {reason}")
+                if pooled.active == 0:
+                    await self._close(pooled)
+                else:
+                    self._draining.append(pooled)
+        except Exception as e:
+            logging.error(f"Error recycling pooled browser {pooled.index}: {str(e)}")
+        finally:
+            self._recycling.discard(pooled.index)
+
+    @asynccontextmanager
+    async def context(self, engine: str = 'chromium', launch_args: List[str] = None, **options) -> AsyncIterator[BrowserContext]:
+        """Create a fresh browser context on one of the pooled browsers.
+
+        `engine` and `launch_args` select the browser, all other keyword arguments are
+        passed to `Browser.new_context`. The context is closed when the block exits; the
+        browser stays alive for the next run. Raises MemoryPressureError when the run
+        cannot be admitted.
+        """
+        key = None
+        if engine != 'chromium' or launch_args:
+            key = (engine, tuple(launch_args or ()))
+        pooled = await self._acquire(key)
+        context = None
+        try:
+            context = await pooled.browser.new_context(**options)
+            self._owners[context] = pooled
+            yield context
+        except Exception:
+            self._failed_runs += 1
+            raise
+        finally:
+            if context is not None:
+                self._owners.pop(context, None)
+                try:
+                    await context.close()
+                except Exception as e:
+                    logging.warning(f"Error closing browser context: {str(e)}")
+            await self._release(pooled)
+
+    async def measure_run(self, page: Page, domain: str) -> Dict[str, Any]:
+        """Measure the memory used by a run: the JS heap of its page and the RSS of its browser"""
+        pooled = self._owners.get(page.context)
+        js_heap = None
+        try:
+            # performance.memory is Chromium only
+            js_heap = await page.evaluate('() => performance.memory ? performance.memory.usedJSHeapSize : null')
+        except Exception:
+            pass
+
+        browser_rss = None
+        if pooled and pooled.marker:
+            await self.sample_memory()
+            browser_rss = pooled.rss
+
+        measurement = {
+            "domain": domain,
+            "browser_index": pooled.index if pooled else None,
+            "js_heap_used_bytes": js_heap,
+            "browser_rss_bytes": browser_rss,
+            "timestamp": datetime.now().isoformat()
+        }
+        self._recent_runs.append(measurement)
+        return measurement
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return pool statistics, with the memory of the last sample"""
+        total_rss = self._total_rss if self.started else None
+        browsers = [slot for slot in self._slots if slot] + list(self._extra.values())
+        return {
+            "started": self.started,
+            "size": self.size,
+            "max_runs_per_browser": self.max_runs,
+            "headless": self.headless,
+            "endpoints": self.endpoints,
+            "fallback_launches": self._fallbacks,
+            "launches": self._launches,
+            "restarts": self._restarts,
+            "memory_restarts": self._memory_restarts,
+            "total_runs": self._total_runs,
+            "failed_runs": self._failed_runs,
+            "active_contexts": sum(b.active for b in self._browsers()),
+            "draining": len(self._draining),
+            "memory": {
+                "total_rss_bytes": total_rss,
+                "browser_limit_bytes": self.memory_limit,
+                "watermark_bytes": self.memory_watermark,
+                "queued_runs": self._queued,
+                "refused_runs": self._refused
+            },
+            "browsers": [b.get_stats() for b in browsers],
+            "recent_runs": list(self._recent_runs)
+        }
+
+
+# Shared pool used by the API, the calculator and the scraper
+browser_pool = BrowserPool()
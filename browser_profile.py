@@ -0,0 +1,64 @@
+from typing import Dict, Any, List
+import copy
+
+ENGINES = ('chromium', 'firefox', 'webkit')
+
+# Defaults for the `browser` section of a domain config, the settings used before
+# browser profiles existed
+DEFAULT_BROWSER_PROFILE = {
+    'engine': 'chromium',
+    'viewport': {'width': 1920, 'height': 1080},
+    'device_scale_factor': 1,
+    'args': [],                  # Extra launch flags, browsers with other flags are launched separately
+    'java_script_enabled': True,
+    'locale': None,
+    'timezone_id': None
+}
+
+# Profiles tried by benchmark_profiles.py, from the default to the most stripped down
+CANDIDATE_PROFILES = [
+    {'name': 'default'},
+    {'name': 'chromium-1280', 'viewport': {'width': 1280, 'height': 800}},
+    {'name': 'chromium-800', 'viewport': {'width': 800, 'height': 600}},
+    {
+        'name': 'chromium-lean',
+        'viewport': {'width': 1280, 'height': 800},
+        'args': [
+            '--disable-extensions',
+            '--disable-background-networking',
+            '--disable-component-update',
+            '--disable-default-apps',
+            '--disable-sync',
+            '--mute-audio'
+        ]
+    },
+    {'name': 'firefox-1280', 'engine': 'firefox', 'viewport': {'width': 1280, 'height': 800}},
+    {'name': 'webkit-1280', 'engine': 'webkit', 'viewport': {'width': 1280, 'height': 800}}
+]
+
+
+def browser_profile(domain_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the browser profile of a domain merged with the defaults"""
+    profile = copy.deepcopy(DEFAULT_BROWSER_PROFILE)
+    profile.update(domain_config.get('browser') or {})
+    profile.pop('name', None)
+    if profile['engine'] not in ENGINES:
+        raise ValueError(f"Unknown browser engine '{profile['engine']}', use one of: {', '.join(ENGINES)}")
+    return profile
+
+
+def context_options(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Options for `Browser.new_context` described by a profile"""
+    options = {
+        'viewport': profile['viewport'],
+        'device_scale_factor': profile['device_scale_factor'],
+        'java_script_enabled': profile['java_script_enabled']
+    }
+    for name in ('locale', 'timezone_id'):
+        if profile.get(name):
+            options[name] = profile[name]
+    return options
+
+
+def candidate_profiles() -> List[Dict[str, Any]]:
+    return copy.deepcopy(CANDIDATE_PROFILES)
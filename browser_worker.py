@@ -0,0 +1,31 @@
+import argparse
+import os
+import sys
+
+
+def main():
+    """Run a Playwright browser server that the browser pool can connect to.
+
+    Start one worker per machine (or container) and list their endpoints in
+    BROWSER_ENDPOINTS, e.g. BROWSER_ENDPOINTS=ws://worker-1:3000/,ws://worker-2:3000/
+    """
+    parser = argparse.ArgumentParser(description='Run a remote browser worker')
+    parser.add_argument('--host', default='0.0.0.0', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=3000, help='Port to listen on')
+    parser.add_argument('--path', default='/', help='URL path of the endpoint, use a secret value on public networks')
+
+    args = parser.parse_args()
+
+    print(f"Browser worker listening on ws://{args.host}:{args.port}{args.path}")
+    sys.stdout.flush()
+    # The server must use the same Playwright version as the API, so run the bundled driver
+    os.execvp(sys.executable, [
+        sys.executable, '-m', 'playwright', 'run-server',
+        '--host', args.host,
+        '--port', str(args.port),
+        '--path', args.path
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,30 @@ IS_PRODUCTION = ENV == 'production'
 HEADLESS = IS_PRODUCTION  # True in production, False in development
 # HEADLESS = True
 
+# Browser pool settings
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '2'))  # Number of long-lived browsers
+BROWSER_MAX_RUNS = int(os.getenv('BROWSER_MAX_RUNS', '50'))  # Restart a browser after this many runs
+BROWSER_MEMORY_LIMIT_MB = int(os.getenv('BROWSER_MEMORY_LIMIT_MB', '1024'))  # Restart a browser above this RSS
+MEMORY_WATERMARK_MB = int(os.getenv('MEMORY_WATERMARK_MB', '3072'))  # Queue new runs above this total RSS (0 = off)
+MEMORY_ADMISSION_TIMEOUT = float(os.getenv('MEMORY_ADMISSION_TIMEOUT', '60'))  # Seconds a queued run waits before it is refused
+SWEEP_MAX_PARALLEL = int(os.getenv('SWEEP_MAX_PARALLEL', '8'))  # Most contexts a sweep request may run at a time
+
+# Time budget of a calculation when the request sets no deadline
+CALCULATION_TIMEOUT_MS = int(os.getenv('CALCULATION_TIMEOUT_MS', '120000'))
+
+# Remote browser workers, comma separated Playwright server endpoints (ws://host:port/)
+BROWSER_ENDPOINTS = [e.strip() for e in os.getenv('BROWSER_ENDPOINTS', '').split(',') if e.strip()]
+BROWSER_CONNECT_TIMEOUT = float(os.getenv('BROWSER_CONNECT_TIMEOUT', '10'))  # Seconds before falling back to a local browser
+BROWSER_RECONNECT_INTERVAL = float(os.getenv('BROWSER_RECONNECT_INTERVAL', '60'))  # Seconds before a fallback browser retries its endpoint
+
+# Persistent data (the /data volume on Fly.io)
+DATA_DIR = os.getenv('DATA_DIR', '/data' if IS_PRODUCTION else './data')
+
+# Shared cache for static scripts and stylesheets
+ASSET_CACHE_ENABLED = os.getenv('ASSET_CACHE_ENABLED', 'true').lower() == 'true'
+ASSET_CACHE_DIR = os.getenv('ASSET_CACHE_DIR', os.path.join(DATA_DIR, 'asset_cache'))
+ASSET_CACHE_MAX_MB = int(os.getenv('ASSET_CACHE_MAX_MB', '256'))
+
 # Database settings
 USE_POSTGRES_LOCALLY = os.getenv('USE_POSTGRES_LOCALLY', 'true').lower() == 'true'
 LOCAL_DATABASE_URL = "postgresql://localhost/competitor_price_watcher" if USE_POSTGRES_LOCALLY else "sqlite:///./competitor_price_watcher.db" 
\ No newline at end of file
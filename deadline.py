@@ -0,0 +1,88 @@
+from typing import Optional, Awaitable, TypeVar
+from contextvars import ContextVar
+import asyncio
+import time
+
+T = TypeVar('T')
+
+# Deadline of the calculation executing in the current task
+_deadline: ContextVar[Optional['Deadline']] = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(RuntimeError):
+    """A calculation ran out of its time budget"""
+
+    def __init__(self, budget_ms: float, activity: Optional[str]):
+        self.budget_ms = budget_ms
+        self.activity = activity
+        super().__init__(f"Time budget of {budget_ms:.0f} ms exceeded during {activity or 'the calculation'}")
+
+
+class Deadline:
+    """The moment a calculation must be finished, and what it is doing right now"""
+
+    __slots__ = ('budget_ms', 'expires_at', 'activity')
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        # Shared with the tasks of the calculation, so the error can name the running step
+        self.activity: Optional[str] = None
+
+    def remaining_ms(self) -> float:
+        return (self.expires_at - time.monotonic()) * 1000
+
+    def exceeded(self) -> DeadlineExceeded:
+        return DeadlineExceeded(self.budget_ms, self.activity)
+
+
+def start(budget_ms: float):
+    """Give the calculation of the current task a time budget, returns a token for `reset`"""
+    return _deadline.set(Deadline(float(budget_ms)))
+
+
+def reset(token):
+    _deadline.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+def set_activity(activity: str):
+    """Name what the calculation is doing, for the error when the budget runs out"""
+    deadline = _deadline.get()
+    if deadline:
+        deadline.activity = activity
+
+
+def check():
+    """Raise DeadlineExceeded when the budget is used up, call this before retrying"""
+    deadline = _deadline.get()
+    if deadline and deadline.remaining_ms() <= 0:
+        raise deadline.exceeded()
+
+
+def timeout(ms: float) -> float:
+    """A timeout in ms shortened to the remaining budget"""
+    deadline = _deadline.get()
+    if not deadline:
+        return ms
+    remaining = deadline.remaining_ms()
+    if remaining <= 0:
+        raise deadline.exceeded()
+    return min(float(ms), remaining)
+
+
+async def run(awaitable: Awaitable[T]) -> T:
+    """Await within the remaining budget, cancels the awaitable when it runs out"""
+    deadline = _deadline.get()
+    if not deadline:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(deadline.remaining_ms(), 0) / 1000)
+    except asyncio.TimeoutError:
+        if deadline.remaining_ms() > 0:
+            # A timeout of something else inside the awaitable
+            raise
+        raise deadline.exceeded()
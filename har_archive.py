@@ -0,0 +1,114 @@
+from typing import Dict, Any, Optional
+from contextvars import ContextVar
+import copy
+import json
+import os
+import re
+import time
+from config import DATA_DIR
+
+HAR_DIR = os.path.join(DATA_DIR, 'har')
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Recording or replay of the run executing in the current task
+_session: ContextVar[Optional['HarSession']] = ContextVar('har_session', default=None)
+
+
+class HarSession:
+    """Records the network traffic of a run into a HAR archive, or serves a run from one.
+
+    A replay never touches the network: requests that are not in the archive are aborted.
+    """
+
+    def __init__(self, mode: str, har_path: str):
+        self.mode = mode
+        self.har_path = har_path
+        # Filled in by the run when recording
+        self.storage_state: Optional[Dict[str, Any]] = None
+
+    def context_options(self) -> Dict[str, Any]:
+        # Service workers would answer requests before the routes see them
+        options = {'service_workers': 'block'}
+        if self.mode == RECORD:
+            options['record_har_path'] = self.har_path
+            options['record_har_mode'] = 'full'
+        return options
+
+    async def install(self, context):
+        """Serve the requests of a context from the archive, call this after all other routes"""
+        if self.mode == REPLAY:
+            await context.route_from_har(self.har_path, not_found='abort')
+
+    async def capture(self, page):
+        """Keep the storage state of the page at the end of a recorded run"""
+        if self.mode == RECORD:
+            self.storage_state = await page.context.storage_state()
+
+
+def current() -> Optional[HarSession]:
+    return _session.get()
+
+
+def set_session(session: HarSession):
+    """Record or replay the runs of the current task, returns a token for `reset_session`"""
+    return _session.set(session)
+
+
+def reset_session(token):
+    _session.reset(token)
+
+
+def offline_config(domain_config: Dict[str, Any], category: str) -> Dict[str, Any]:
+    """Copy of a domain config with only `category`, whose runs always start from a fresh page on the network.
+
+    Pre-loaded pages, session snapshots and the asset cache would serve parts of a recorded
+    run from somewhere else than the archive.
+    """
+    config = copy.deepcopy(domain_config)
+    config['categories'] = {category: config['categories'][category]}
+    config['warm_pool'] = {'enabled': False}
+    config['asset_cache'] = {'enabled': False}
+    config['categories'][category]['storage_state'] = {'enabled': False}
+    return config
+
+
+class HarArchive:
+    """HAR archives per domain and category, with the run they were recorded for.
+
+    Next to the archive a JSON file keeps the URL, dimensions, configuration and price of
+    the recorded run and the storage state at its end.
+    """
+
+    def __init__(self, directory: str = HAR_DIR):
+        self.directory = directory
+
+    def _path(self, domain: str, category: str, extension: str) -> str:
+        name = re.sub(r'[^a-zA-Z0-9_.-]', '_', f"{domain}__{category}")
+        return os.path.join(self.directory, f"{name}{extension}")
+
+    def recording(self, domain: str, category: str) -> HarSession:
+        os.makedirs(self.directory, exist_ok=True)
+        return HarSession(RECORD, self._path(domain, category, '.har.zip'))
+
+    def replaying(self, domain: str, category: str) -> HarSession:
+        path = self._path(domain, category, '.har.zip')
+        if not os.path.exists(path):
+            raise ValueError(f"No HAR recording found for {domain}/{category}")
+        return HarSession(REPLAY, path)
+
+    def save_run(self, domain: str, category: str, run: Dict[str, Any], session: HarSession):
+        """Store the recorded run next to its archive"""
+        run = dict(run, domain=domain, category=category, recorded_at=time.time(), storage_state=session.storage_state)
+        path = self._path(domain, category, '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(run, f)
+        os.replace(path + '.tmp', path)
+
+    def load_run(self, domain: str, category: str) -> Dict[str, Any]:
+        try:
+            with open(self._path(domain, category, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise ValueError(f"No HAR recording found for {domain}/{category}")
@@ -0,0 +1,46 @@
+from typing import Optional
+import asyncio
+import aiohttp
+
+# Pages are requested like a regular desktop browser would
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/132.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'nl-NL,nl;q=0.9,en;q=0.8'
+}
+
+
+class HttpClient:
+    """A shared aiohttp session for requests that do not need a browser.
+
+    Connections are kept alive and reused between runs. Cookies are never stored, so
+    one run cannot influence the next.
+    """
+
+    def __init__(self, limit: int = 50, timeout: float = 30):
+        self.limit = limit
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    self._session = aiohttp.ClientSession(
+                        connector=aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300),
+                        timeout=aiohttp.ClientTimeout(total=self.timeout),
+                        cookie_jar=aiohttp.DummyCookieJar(),
+                        headers=DEFAULT_HEADERS
+                    )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Shared client used by the fast paths of the calculator
+http_client = HttpClient()
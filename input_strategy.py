@@ -0,0 +1,202 @@
+from typing import Dict, Any, List, Optional
+import json
+import logging
+import os
+import time
+from config import DATA_DIR
+
+INPUT_STRATEGY_FILE = os.path.join(DATA_DIR, 'input_strategies.json')
+
+# Ways to set the value of an input field, fastest first. `type` clears the field and
+# types the value key by key, which the other strategies fall back to.
+STRATEGIES = ('fill', 'native-setter', 'type')
+
+# Try the strategies in order and remember the first one that works
+AUTO = 'auto'
+
+DEFAULT_STRATEGY = 'type'
+
+# Sets the value through the setter of the element prototype, so frameworks that track the
+# value of controlled inputs (React, Vue) notice the change, and fires the events a user would
+NATIVE_SETTER_SCRIPT = """([el, value]) => {
+    const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    const descriptor = Object.getOwnPropertyDescriptor(proto, 'value');
+    el.focus();
+    if (descriptor && descriptor.set) {
+        descriptor.set.call(el, value);
+    } else {
+        el.value = value;
+    }
+    el.dispatchEvent(new Event('input', { bubbles: true }));
+    el.dispatchEvent(new Event('change', { bubbles: true }));
+    el.dispatchEvent(new Event('blur', { bubbles: true }));
+    return el.value;
+}"""
+
+# Fill only fires an input event, sites often recalculate on change or blur
+FILL_EVENTS_SCRIPT = """(el) => {
+    el.dispatchEvent(new Event('change', { bubbles: true }));
+    el.dispatchEvent(new Event('blur', { bubbles: true }));
+    return el.value;
+}"""
+
+# Sets many fields in one round trip, the same way as NATIVE_SETTER_SCRIPT. Selects get the
+# option whose value or text equals the value. Returns per field whether it was found, is a
+# select, was already set and the value it holds afterwards, with the option text for selects.
+FILL_FORM_SCRIPT = """([fields, skipIfSet]) => fields.map(([selector, value]) => {
+    let el;
+    try {
+        el = document.querySelector(selector);
+    } catch (e) {
+        el = null;
+    }
+    if (!el || !('value' in el)) {
+        return { selector, found: false, select: false, unchanged: false, value: null, text: null };
+    }
+    const select = el instanceof HTMLSelectElement;
+    const text = () => select && el.selectedIndex >= 0 ? el.options[el.selectedIndex].text.trim() : null;
+    if (skipIfSet && (el.value === value || (select && text() === value))) {
+        return { selector, found: true, select, unchanged: true, value: el.value, text: text() };
+    }
+    if (select) {
+        const option = Array.from(el.options).find(o => o.value === value || o.text.trim() === value);
+        if (option) {
+            el.value = option.value;
+        }
+    } else {
+        const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+        const descriptor = Object.getOwnPropertyDescriptor(proto, 'value');
+        el.focus();
+        if (descriptor && descriptor.set) {
+            descriptor.set.call(el, value);
+        } else {
+            el.value = value;
+        }
+        el.dispatchEvent(new Event('input', { bubbles: true }));
+    }
+    el.dispatchEvent(new Event('change', { bubbles: true }));
+    el.dispatchEvent(new Event('blur', { bubbles: true }));
+    return { selector, found: true, select, unchanged: false, value: el.value, text: text() };
+})"""
+
+
+def step_strategy(step: Dict[str, Any]) -> str:
+    """Return the input strategy of a step"""
+    strategy = step.get('input_strategy') or DEFAULT_STRATEGY
+    if strategy != AUTO and strategy not in STRATEGIES:
+        raise ValueError(f"Unknown input_strategy '{strategy}', use one of {', '.join(STRATEGIES + (AUTO,))}")
+    return strategy
+
+
+def value_matches(actual: Any, expected: Any) -> bool:
+    """The field holds the value, sites may add formatting such as a unit around it"""
+    actual = str(actual)
+    expected = str(expected)
+    return actual == expected or expected in actual
+
+
+def holds_value(actual: Any, expected: Any) -> bool:
+    """The field already holds exactly the value, so setting it again changes nothing"""
+    actual = str(actual).strip()
+    expected = str(expected).strip()
+    if actual == expected:
+        return True
+    try:
+        return float(actual.replace(',', '.')) == float(expected.replace(',', '.'))
+    except ValueError:
+        return False
+
+
+async def apply(element, strategy: str, value: str) -> str:
+    """Set the value with a fast strategy and return the value the field holds afterwards"""
+    if strategy == 'fill':
+        await element.fill(value)
+        return await element.evaluate(FILL_EVENTS_SCRIPT)
+    if strategy == 'native-setter':
+        return await element.evaluate(NATIVE_SETTER_SCRIPT, [element, value])
+    raise ValueError(f"Input strategy '{strategy}' cannot be applied directly")
+
+
+def field_matches(result: Dict[str, Any], expected: str) -> bool:
+    """Whether a field of FILL_FORM_SCRIPT holds exactly its value, a select may also match on its option text"""
+    if not result['found']:
+        return False
+    if holds_value(result['value'], expected):
+        return True
+    return result['select'] and result['text'] is not None and holds_value(result['text'], expected)
+
+
+async def fill_form(page, fields: Dict[str, str], skip_if_set: bool = True) -> List[Dict[str, Any]]:
+    """Set all fields in one evaluation, see FILL_FORM_SCRIPT for the result of each field"""
+    return await page.evaluate(FILL_FORM_SCRIPT, [[[selector, value] for selector, value in fields.items()], skip_if_set])
+
+
+class InputStrategyStore:
+    """The input strategy that worked per domain and selector, kept across restarts.
+
+    Steps with `input_strategy: auto` try the stored strategy first and only try the
+    others when it no longer sets the value.
+    """
+
+    def __init__(self, path: str = INPUT_STRATEGY_FILE):
+        self.path = path
+        self._strategies: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+        self._fallbacks = 0
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if self._strategies is None:
+            try:
+                with open(self.path) as f:
+                    self._strategies = json.load(f)
+            except (OSError, ValueError):
+                self._strategies = {}
+        return self._strategies
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self._strategies, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            logging.warning(f"Could not save input strategies: {str(e)}")
+
+    def get(self, domain: str, selector: str) -> Optional[str]:
+        entry = self._load().get(domain, {}).get(selector)
+        return entry['strategy'] if entry else None
+
+    def order(self, domain: Optional[str], selector: str, strategy: str) -> List[str]:
+        """The strategies to try for a step, the stored one first for `auto`"""
+        if strategy != AUTO:
+            return [strategy]
+        learned = self.get(domain, selector) if domain else None
+        if learned not in STRATEGIES:
+            return list(STRATEGIES)
+        return [learned] + [name for name in STRATEGIES if name != learned]
+
+    def record(self, domain: Optional[str], selector: str, strategy: str, attempts: int = 1):
+        """Remember the strategy that set the value, `attempts` counts the strategies tried"""
+        if not domain:
+            return
+        if attempts > 1:
+            self._fallbacks += 1
+        selectors = self._load().setdefault(domain, {})
+        entry = selectors.get(selector)
+        if entry and entry['strategy'] == strategy:
+            entry['successes'] += 1
+            entry['last_used'] = time.time()
+            # Only changes of the strategy are written right away
+            if entry['successes'] % 20:
+                return
+        else:
+            selectors[selector] = {"strategy": strategy, "successes": 1, "last_used": time.time()}
+            logging.info(f"Using input strategy {strategy} for {domain} {selector}")
+        self._save()
+
+    def get_stats(self) -> Dict[str, Any]:
+        strategies = self._load()
+        return {
+            "domains": strategies,
+            "selectors": sum(len(selectors) for selectors in strategies.values()),
+            "fallbacks": self._fallbacks
+        }
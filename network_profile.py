@@ -0,0 +1,153 @@
+from typing import Dict, Any, Optional, List
+from fnmatch import fnmatch
+import logging
+
+# Resource types that never influence the price on the page
+DEFAULT_BLOCKED_RESOURCE_TYPES = ['image', 'media', 'font']
+
+# Analytics, advertising and chat widgets. Consent managers are deliberately not
+# listed, because configs often contain click steps for their banners.
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    '*google-analytics.com/*',
+    '*googletagmanager.com/*',
+    '*doubleclick.net/*',
+    '*googleadservices.com/*',
+    '*connect.facebook.net/*',
+    '*facebook.com/tr*',
+    '*bat.bing.com/*',
+    '*clarity.ms/*',
+    '*hotjar.com/*',
+    '*analytics.tiktok.com/*',
+    '*snap.licdn.com/*',
+    '*widget.intercom.io/*',
+    '*embed.tawk.to/*',
+    '*static.zdassets.com/*',
+    '*cdn.livechatinc.com/*',
+    '*client.crisp.chat/*',
+    '*code.tidio.co/*',
+    '*smartsupp.com/*'
+]
+
+
+class NetworkStats:
+    """Requests and bytes of a single browser context"""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_received = 0
+        self.blocked_requests = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.bytes_saved_estimate = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "bytes_received": self.bytes_received,
+            "blocked_requests": self.blocked_requests,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "bytes_saved_estimate": self.bytes_saved_estimate
+        }
+
+
+class NetworkProfile:
+    """Request routing rules from the `network` section of a domain config"""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.block_resource_types = set(settings.get('block_resource_types', DEFAULT_BLOCKED_RESOURCE_TYPES))
+        self.block_url_patterns: List[str] = list(settings.get('block_url_patterns', DEFAULT_BLOCKED_URL_PATTERNS))
+        self.block_url_patterns += settings.get('extra_block_url_patterns', [])
+        self.allow_url_patterns: List[str] = list(settings.get('allow_url_patterns', []))
+
+    @classmethod
+    def from_config(cls, domain_config: Dict[str, Any]) -> Optional['NetworkProfile']:
+        """Create a profile if the domain config has an enabled `network` section"""
+        settings = domain_config.get('network')
+        if settings is None or not settings.get('enabled', True):
+            return None
+        return cls(settings)
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if any(fnmatch(url, pattern) for pattern in self.allow_url_patterns):
+            return False
+        if resource_type in self.block_resource_types:
+            return True
+        return any(fnmatch(url, pattern) for pattern in self.block_url_patterns)
+
+
+class NetworkMonitor:
+    """Tracks network usage per browser context and applies network profiles.
+
+    Blocked requests are aborted before they are sent, so their size is unknown. The
+    saved bytes are estimated from the average size of responses of the same resource
+    type that were not blocked.
+    """
+
+    def __init__(self):
+        self._contexts: Dict[Any, NetworkStats] = {}
+        self._domain_totals: Dict[str, Dict[str, Any]] = {}
+        self._type_sizes: Dict[str, List[int]] = {}
+
+    def _average_size(self, resource_type: str) -> int:
+        total, count = self._type_sizes.get(resource_type, (0, 0))
+        return total // count if count else 0
+
+    def _record_response(self, stats: NetworkStats, response):
+        stats.requests += 1
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            size = int(length)
+            stats.bytes_received += size
+            totals = self._type_sizes.setdefault(response.request.resource_type, [0, 0])
+            totals[0] += size
+            totals[1] += 1
+
+    async def attach(self, context, domain_config: Dict[str, Any]) -> NetworkStats:
+        """Start tracking a context and install the domain's network profile on it"""
+        stats = NetworkStats()
+        self._contexts[context] = stats
+        context.on('response', lambda response: self._record_response(stats, response))
+        context.on('close', lambda _: self._contexts.pop(context, None))
+
+        profile = NetworkProfile.from_config(domain_config)
+        if profile:
+            async def handle_route(route):
+                request = route.request
+                if profile.should_block(request.url, request.resource_type):
+                    stats.blocked_requests += 1
+                    stats.blocked_by_type[request.resource_type] = stats.blocked_by_type.get(request.resource_type, 0) + 1
+                    stats.bytes_saved_estimate += self._average_size(request.resource_type)
+                    await route.abort('blockedbyclient')
+                else:
+                    await route.fallback()
+
+            await context.route('**/*', handle_route)
+        return stats
+
+    def stats_for(self, context) -> Optional[NetworkStats]:
+        return self._contexts.get(context)
+
+    def finish_run(self, domain: str, stats: NetworkStats):
+        """Add the stats of a finished run to the totals of its domain"""
+        totals = self._domain_totals.setdefault(domain, {
+            "runs": 0,
+            "requests": 0,
+            "bytes_received": 0,
+            "blocked_requests": 0,
+            "bytes_saved_estimate": 0
+        })
+        totals["runs"] += 1
+        totals["requests"] += stats.requests
+        totals["bytes_received"] += stats.bytes_received
+        totals["blocked_requests"] += stats.blocked_requests
+        totals["bytes_saved_estimate"] += stats.bytes_saved_estimate
+        logging.info(f"Network usage for {domain}: {stats.as_dict()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return network totals per domain"""
+        return {
+            "domains": {domain: dict(totals) for domain, totals in self._domain_totals.items()},
+            "average_bytes_by_type": {
+                resource_type: total // count
+                for resource_type, (total, count) in self._type_sizes.items() if count
+            }
+        }
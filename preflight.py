@@ -0,0 +1,86 @@
+from typing import Dict, Any, Optional, List
+from step_plan import StepPlan
+
+# Defaults for the `preflight` section of a category config
+DEFAULT_PREFLIGHT_SETTINGS = {
+    'enabled': True,
+    'fail_on_missing': True   # Abort when a step marked `upfront` has no element on the page
+}
+
+VISIBLE = 'visible'
+HIDDEN = 'hidden'
+MISSING = 'missing'
+# Playwright selectors such as text= or :has-text() cannot be checked with querySelector
+UNCHECKED = 'unchecked'
+
+# State of every selector in one round trip, a step with a fallback chain counts as the
+# best state of its candidates
+PREFLIGHT_SCRIPT = """(entries) => entries.map(([index, selectors]) => {
+    const rank = { visible: 3, hidden: 2, missing: 1, unchecked: 0 };
+    let best = { index, selector: selectors[0], state: 'unchecked' };
+    for (const selector of selectors) {
+        let state;
+        try {
+            const el = document.querySelector(selector);
+            if (!el) {
+                state = 'missing';
+            } else {
+                const style = window.getComputedStyle(el);
+                const rect = el.getBoundingClientRect();
+                const visible = style.visibility !== 'hidden' && style.display !== 'none' && rect.width > 0 && rect.height > 0;
+                state = visible ? 'visible' : 'hidden';
+            }
+        } catch (e) {
+            state = 'unchecked';
+        }
+        if (rank[state] > rank[best.state]) {
+            best = { index, selector, state };
+        }
+    }
+    return best;
+})"""
+
+
+def preflight_settings(category_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the preflight settings of a category, or None if no preflight is run"""
+    settings = category_config.get('preflight')
+    if not settings:
+        return None
+    merged = dict(DEFAULT_PREFLIGHT_SETTINGS)
+    if isinstance(settings, dict):
+        merged.update(settings)
+    if not merged['enabled']:
+        return None
+    return merged
+
+
+async def check(page, plan: StepPlan, start: int = 0) -> List[Dict[str, Any]]:
+    """The state of the selector of every step from `start` on, with whether it must exist up front"""
+    entries = []
+    for plan_step in plan.steps[start:]:
+        # Every field of a fill_form step is checked on its own
+        for selector in plan_step.options.get('fields', {}) if plan_step.type == 'fill_form' else ():
+            entries.append([plan_step.index, [selector]])
+        if not plan_step.selector:
+            continue
+        selectors = plan_step.options.get('selector_candidates') or [plan_step.selector]
+        entries.append([plan_step.index, list(selectors)])
+    if not entries:
+        return []
+    results = await page.evaluate(PREFLIGHT_SCRIPT, entries)
+    for result in results:
+        plan_step = plan.steps[result['index']]
+        result['type'] = plan_step.type
+        result['upfront'] = bool(plan_step.options.get('upfront'))
+    return results
+
+
+def diagnose(results: List[Dict[str, Any]], url: str) -> Optional[str]:
+    """Describe the steps marked `upfront` whose selector has no element, None if all are there"""
+    missing = [result for result in results if result['upfront'] and result['state'] == MISSING]
+    if not missing:
+        return None
+    details = '; '.join(
+        f"step {result['index'] + 1} ({result['type']}) selector '{result['selector']}'" for result in missing
+    )
+    return f"Preflight on {url} found no element for {details}"
@@ -1,30 +1,173 @@
-from playwright.async_api import async_playwright, Page, expect
-from typing import Dict, Any, Optional, Tuple, List
+from playwright.async_api import Page, expect
+from typing import Dict, Any, Optional, Tuple, List, AsyncIterator, Union
 import logging
 import re
 import os
 import json
 import asyncio
+import copy
+from contextlib import AsyncExitStack
 from urllib.parse import urlparse
 from datetime import datetime
 from database import SessionLocal
 import crud
-from config import HEADLESS
+import schemas
+from browser_pool import BrowserPool, MemoryPressureError, browser_pool as shared_browser_pool
+from warm_pool import WarmPagePool
+from network_profile import NetworkMonitor
+from asset_cache import AssetCache
+from storage_state import StorageStateStore, storage_state_settings
+import turbo_mode
+import deadline
+import waits
+import price_settle
+import har_archive
+from har_archive import HarArchive
+import input_strategy
+import step_registry
+from step_registry import StepRegistry, StepCall, RunTimings
+from input_strategy import InputStrategyStore
+import selector_chain
+import preflight
+from selector_chain import SelectorStatsStore
+from step_plan import PlanCache, ExecutionContext, StepPlan, Template
+from browser_profile import browser_profile, context_options
+from http_client import http_client
+from static_page import StaticPriceReader, http_settings
+from price_endpoint import PriceEndpointRecorder, PriceEndpointReader, learn_request, xhr_settings
+from config import ASSET_CACHE_ENABLED, CALCULATION_TIMEOUT_MS
 import random
 import string
 
 logging.basicConfig(level=logging.INFO)
 
+# True once a captcha checkbox (matched by the selector argument) has been checked
+CAPTCHA_CHECKED_SCRIPT = """(selector) => {
+    const el = document.querySelector(selector);
+    return !!el && (el.getAttribute('aria-checked') === 'true' || el.checked === true);
+}"""
+
+# Reads every element matching a select step's selector in one roundtrip. Select options are
+# matched on their text, radio buttons and checkboxes on their value attribute and other
+# elements on their text. Returns the closest candidate and the whole table for diagnostics.
+SELECT_CANDIDATES_SCRIPT = """(elements, target) => {
+    const number = (text) => {
+        const match = /(\\d+(?:\\.\\d+)?)/.exec(text || '');
+        return match ? parseFloat(match[1]) : null;
+    };
+    const short = (text) => (text || '').trim().slice(0, 80);
+    const candidates = [];
+    let best = null;
+    const consider = (candidate) => {
+        candidate.diff = candidate.option_value === null ? null : Math.abs(candidate.option_value - target);
+        candidates.push(candidate);
+        if (candidate.diff !== null && (best === null || candidate.diff < best.diff)) {
+            best = candidate;
+        }
+    };
+    elements.forEach((el, index) => {
+        const tag = el.tagName.toLowerCase();
+        const type = tag === 'input' ? el.getAttribute('type') : null;
+        const value = el.getAttribute('value');
+        if (tag === 'select') {
+            for (const option of Array.from(el.options)) {
+                const text = option.text.trim();
+                consider({ index, tag, type, kind: 'select', value: option.value, text: short(text), option_value: number(text),
+                           selected: option.selected });
+            }
+        } else if (type === 'radio' || type === 'checkbox') {
+            consider({ index, tag, type, kind: 'input', value, text: short(el.textContent), option_value: number(value),
+                       selected: el.checked });
+        } else {
+            const text = el.textContent;
+            const selected = el.getAttribute('aria-checked') === 'true' || el.getAttribute('aria-selected') === 'true';
+            consider({ index, tag, type, kind: 'other', value, text: short(text), option_value: number(text), selected });
+        }
+    });
+    return { best, candidates };
+}"""
+
+# Selected option of a native select, null for other elements
+SELECTED_OPTION_SCRIPT = """(el) => {
+    if (el.tagName.toLowerCase() !== 'select' || el.selectedIndex < 0) return null;
+    const option = el.options[el.selectedIndex];
+    return { index: el.selectedIndex, value: option.value, text: option.text.trim() };
+}"""
+
+# Value of the first element matching a selector, null if there is none
+CURRENT_VALUE_SCRIPT = """(selector) => {
+    let el;
+    try {
+        el = document.querySelector(selector);
+    } catch (e) {
+        return null;  // A Playwright selector, checked by the handler itself
+    }
+    return el && 'value' in el ? el.value : null;
+}"""
+
 class PriceCalculator:
     """Calculate prices based on dimensions for different domains"""
     
     # Class variable to store latest status
     latest_status = None
     
-    def __init__(self):
+    def __init__(self, browser_pool: BrowserPool = None):
         """Initialize the calculator"""
+        self.browser_pool = browser_pool or shared_browser_pool
+        self.warm_pool = WarmPagePool()
+        self.network_monitor = NetworkMonitor()
+        self.asset_cache = AssetCache() if ASSET_CACHE_ENABLED else None
+        self.storage_states = StorageStateStore()
+        self.static_reader = StaticPriceReader(http_client)
+        self.endpoint_reader = PriceEndpointReader(http_client)
+        self.steps = StepRegistry()
+        self._register_steps()
+        self.plans = PlanCache(step_types=self.steps.types)
+        self.har_archive = HarArchive()
+        self.input_strategies = InputStrategyStore()
+        self.selector_stats = SelectorStatsStore()
         self._update_status("Initializing calculator")
 
+    def _register_steps(self):
+        """Register the built-in step types, other step types can be added with `self.steps.register`"""
+        self.steps.register('select', lambda call: self._handle_select(call.page, call.step, call.dimensions))
+        self.steps.register('input', lambda call: self._handle_input(call.page, call.step, call.dimensions, call.domain))
+        self.steps.register('fill_form', lambda call: self._handle_fill_form(call.page, call.step, call.dimensions, call.domain))
+        self.steps.register('click', lambda call: self._handle_click(call.page, call.step))
+        self.steps.register('wait', lambda call: self._handle_wait(call.step))
+        self.steps.register('blur', lambda call: self._handle_blur(call.page, call.step))
+        self.steps.register('captcha', lambda call: self._handle_captcha(call.page, call.step))
+        self.steps.register('read_price', lambda call: self._handle_read_price(call.page, call.step))
+        self.steps.register('modify_element', lambda call: self._handle_modify(call.page, call.step))
+        self.steps.prepare_step(self._pick_selector)
+
+    async def start(self):
+        """Start the browser pool and pre-load the product pages listed in warm pool settings"""
+        await self.browser_pool.start()
+        if self.asset_cache:
+            await self.asset_cache.load()
+
+        db = SessionLocal()
+        try:
+            domain_configs = [(config.domain, config.config) for config in crud.get_domain_configs(db)]
+        finally:
+            db.close()
+
+        for domain, domain_config in domain_configs:
+            warm_settings = domain_config.get('warm_pool') or {}
+            if not warm_settings.get('enabled', True):
+                continue
+            for url in warm_settings.get('urls', []):
+                self.warm_pool.warm_up(domain, url, domain_config, self._open_page)
+
+    async def stop(self):
+        """Close pre-loaded pages and the browser pool"""
+        await self.warm_pool.close()
+        await self.browser_pool.stop()
+        await http_client.close()
+        if self.asset_cache:
+            self.asset_cache.save()
+
     def _normalize_domain(self, url: str) -> str:
         """Normalize domain name by removing www. and getting base domain"""
         parsed = urlparse(url if url.startswith('http') else f'http://{url}')
@@ -52,8 +195,12 @@ class PriceCalculator:
         }
         logging.info(f"Status update: {message}")
 
-    async def calculate_price(self, url: str, dimensions: Dict[str, float], country: str = 'nl', category: str = 'square_meter_price') -> Tuple[float, float]:
-        """Calculate price based on dimensions for a specific domain"""
+    def _load_config(self, url: str, country: str, category: str) -> Tuple[str, Dict[str, Any], Dict[str, Any], Optional[str]]:
+        """Return the domain of a URL, its configuration, the country configuration and the config version.
+
+        The version changes with every edit of the stored domain configuration, so compiled
+        plans can be reused without hashing the steps of every run.
+        """
         try:
             # Get domain from URL
             domain = self._normalize_domain(url)
@@ -65,6 +212,8 @@ class PriceCalculator:
                 raise ValueError(f"No configuration found for domain: {domain}")
             
             domain_config = config.config
+            edited_at = config.updated_at or config.created_at
+            version = f"{config.id}@{edited_at.isoformat()}" if edited_at else None
 
             # Get country config
             country_config = crud.get_country_config(db, country)
@@ -77,60 +226,211 @@ class PriceCalculator:
 
         if category not in domain_config['categories']:
             raise ValueError(f"Category '{category}' not supported for domain: {domain}")
+        return domain, domain_config, country_info, version
+
+    async def calculate_price(self, url: str, dimensions: Dict[str, float], country: str = 'nl', category: str = 'square_meter_price',
+                              learn: bool = False, timings: RunTimings = None, timeout_ms: float = None) -> Tuple[float, float]:
+        """Calculate price based on dimensions for a specific domain.
+
+        With `learn` the steps always run in the browser and the request that returned the
+        price is stored in the category config, so later calculations can send it directly.
+        The wall time, retries and round trips of every step are added to `timings`.
+        Every wait and retry is cut to the time left of `timeout_ms`. A calculation that
+        runs out of time is cancelled with DeadlineExceeded, which names the running step.
+        """
+        token = step_registry.set_timings(timings or RunTimings())
+        deadline_token = deadline.start(timeout_ms or CALCULATION_TIMEOUT_MS)
+        try:
+            return await deadline.run(self._calculate_price(url, dimensions, country, category, learn))
+        except deadline.DeadlineExceeded as e:
+            self._update_status(f"Error: {str(e)}", "error")
+            raise
+        finally:
+            deadline.reset(deadline_token)
+            step_registry.reset_timings(token)
+
+    async def calculate_price_with_config(self, url: str, domain_config: Dict[str, Any], dimensions: Dict[str, float],
+                                          country_info: Dict[str, Any], category: str = 'square_meter_price',
+                                          timings: RunTimings = None, timeout_ms: float = None) -> Tuple[float, float]:
+        """Run the browser steps of a category with `domain_config` instead of the stored configuration.
+
+        Used to try a changed configuration, such as another browser profile, before it is
+        saved. The steps always run in the browser, HTTP and learned requests are not used.
+        Timings and the time budget work as in `calculate_price`.
+        """
+        if category not in domain_config['categories']:
+            raise ValueError(f"Category '{category}' not in the given configuration")
+        domain = self._normalize_domain(url)
+        token = step_registry.set_timings(timings or RunTimings())
+        deadline_token = deadline.start(timeout_ms or CALCULATION_TIMEOUT_MS)
+        try:
+            return await deadline.run(self._run_steps(url, domain, domain_config, category, dimensions, country_info))
+        finally:
+            deadline.reset(deadline_token)
+            step_registry.reset_timings(token)
+
+    async def _calculate_price(self, url: str, dimensions: Dict[str, float], country: str, category: str, learn: bool) -> Tuple[float, float]:
+        domain, domain_config, country_info, version = self._load_config(url, country, category)
 
         self._update_status(f"Starting price calculation for {domain}", "config", {"domain": domain})
 
-        async with async_playwright() as p:
-            # Launch browser with headless mode based on environment
-            browser = await p.chromium.launch(headless=HEADLESS)
-            
-            # Create context with viewport settings
-            context = await browser.new_context(
-                viewport={'width': 1920, 'height': 1080}
-            )
-            
-            # Create page from context and set timeout
-            page = await context.new_page()
-            page.set_default_timeout(120000)  # 120 seconds timeout
+        # Server-rendered prices are read with a plain HTTP request
+        static_settings = http_settings(domain_config['categories'][category])
+        if static_settings:
+            try:
+                return await self._calculate_static(domain, static_settings, dimensions, country_info)
+            except Exception as e:
+                if not static_settings['fallback_to_browser'] or not domain_config['categories'][category].get('steps'):
+                    self._update_status(f"Error: {str(e)}", "error")
+                    raise
+                self._update_status(f"HTTP price request failed, falling back to the browser: {str(e)}", "warn")
+
+        # Prices calculated by an AJAX call are requested directly once the call was learned
+        endpoint_settings = xhr_settings(domain_config['categories'][category])
+        if endpoint_settings and not learn:
+            try:
+                return await self._calculate_xhr(domain, endpoint_settings, dimensions, country_info)
+            except Exception as e:
+                if not endpoint_settings['fallback_to_browser']:
+                    self._update_status(f"Error: {str(e)}", "error")
+                    raise
+                self._update_status(f"Learned price request failed, falling back to the browser: {str(e)}", "warn")
+
+        return await self._run_steps(url, domain, domain_config, category, dimensions, country_info, learn=learn, version=version)
+
+    async def _calculate_xhr(self, domain: str, settings: Dict[str, Any], dimensions: Dict[str, float], country_info: Dict[str, Any]) -> Tuple[float, float]:
+        """Send the learned price request of a category without a browser"""
+        self._update_status("Requesting price from learned endpoint", "navigation", {"url": settings['url']})
+        price = await self.endpoint_reader.fetch_price(settings, dimensions, self._convert_value)
+        self._update_status(f"Price found: €{price:.2f}", "read_price", {"price": price})
+
+        price_excl, price_incl = self._apply_vat(price, settings['includes_vat'], country_info)
+        self._update_status(
+            "Price calculation completed",
+            "complete",
+            {
+                "price_excl_vat": price_excl,
+                "price_incl_vat": price_incl
+            }
+        )
+        return price_excl, price_incl
+
+    async def _learn_price_request(self, domain: str, category: str, recorder: PriceEndpointRecorder, price: float,
+                                   run: ExecutionContext, step: Dict[str, Any]):
+        """Store the request that returned the price in the category config"""
+        exchanges = await recorder.finish()
+        template = learn_request(exchanges, price, run.dimensions, run.plan.dimension_keys(), self._convert_value)
+        if not template:
+            self._update_status(f"No request with the price found among {len(exchanges)} requests", "warn", {"domain": domain})
+            return
+        template['includes_vat'] = step.get('includes_vat', False)
+
+        db = SessionLocal()
+        try:
+            config = crud.get_domain_config(db, domain)
+            domain_config = copy.deepcopy(config.config)
+            domain_config['categories'][category]['xhr'] = template
+            crud.create_domain_config(db, schemas.DomainConfigCreate(domain=domain, config=domain_config))
+        finally:
+            db.close()
+        self.endpoint_reader.learned()
+        self._update_status(f"Learned price request {template['method']} {template['url']}", "config",
+                            {"domain": domain, "fields": template['fields'], "price_path": template['price_path']})
+
+    async def _calculate_static(self, domain: str, settings: Dict[str, Any], dimensions: Dict[str, float], country_info: Dict[str, Any]) -> Tuple[float, float]:
+        """Fetch the price from server-rendered HTML without a browser"""
+        render = lambda text: self._render_template(text, dimensions, settings['unit'])
+        self._update_status("Requesting price without browser", "navigation", {"url": render(settings['url'])})
+
+        html = await self.static_reader.fetch(settings, render)
+        price_text = self.static_reader.read_price_text(html, settings['price_selector'])
+        self._update_status("Found price text", "read_price", {"text": price_text})
+        price = self._parse_price_text(price_text)
+        self._update_status(f"Price found: €{price:.2f}", "read_price", {"price": price})
+
+        price_excl, price_incl = self._apply_vat(price, settings['includes_vat'], country_info)
+        self._update_status(
+            "Price calculation completed",
+            "complete",
+            {
+                "price_excl_vat": price_excl,
+                "price_incl_vat": price_incl
+            }
+        )
+        return price_excl, price_incl
+
+    def _render_template(self, text: str, dimensions: Dict[str, float], unit: str = 'mm') -> str:
+        """Replace the dimension placeholders of the step plans with the dimensions in the given unit"""
+        return Template(text).render(dimensions, unit, self._convert_value)[0]
+
+    def _apply_vat(self, price: float, includes_vat: bool, country_info: Dict[str, Any]) -> Tuple[float, float]:
+        """Return the price excluding and including VAT"""
+        vat_rate = country_info['vat_rate']
+        if includes_vat:
+            return price / (1 + vat_rate/100), price
+        return price, price * (1 + vat_rate/100)
+
+    async def _run_steps(self, url: str, domain: str, domain_config: Dict[str, Any], category: str, dimensions: Dict[str, float], country_info: Dict[str, Any], use_snapshot: bool = True, learn: bool = False, version: str = None) -> Tuple[float, float]:
+        """Open the product page and execute the steps of a category"""
+        steps = domain_config['categories'][category]['steps']
+        try:
+            plan = self.plans.get(domain, category, steps, version)
+        except ValueError as e:
+            self._update_status(f"Error: {str(e)}", "error")
+            raise
+        run = ExecutionContext(plan, dimensions, self._convert_value)
 
+        # Start from a stored storage_state snapshot and skip the setup steps if possible
+        snapshot_settings = storage_state_settings(domain_config['categories'][category])
+        setup_steps = int(snapshot_settings['setup_steps']) if snapshot_settings else 0
+        fingerprint = StorageStateStore.fingerprint(steps[:setup_steps]) if setup_steps else None
+        storage_state = None
+        if snapshot_settings and use_snapshot:
+            storage_state = self.storage_states.load(domain, category, fingerprint, float(snapshot_settings['ttl']))
+
+        async with AsyncExitStack() as stack:
+            self._apply_run_settings(stack, domain_config)
+            page = None
+            # Keep the final DOM and storage state of a recorded run
+            har = har_archive.current()
             try:
-                # Navigate to URL with increased timeout
-                self._update_status(f"Navigating to {url}", "navigation", {"url": url})
-                await page.goto(url, timeout=120000)  # 120 seconds timeout
-                self._update_status("Waiting for page to be fully loaded", "loading")
-                await page.wait_for_load_state('networkidle')
-                self._update_status("Page loaded successfully", "loaded")
-                await page.wait_for_timeout(100)  # Small delay to ensure status is sent
+                page = await self._acquire_page(stack, url, domain, domain_config, storage_state)
+                if storage_state:
+                    self._update_status(f"Restored session state, skipping {setup_steps} setup steps", "config", {"domain": domain})
+                await self._preflight(page, url, plan, domain_config['categories'][category], setup_steps if storage_state else 0)
+
+                # Watch the price before the action that changes it, if read_price waits for it to settle
+                settle_watches = self._settle_watches([plan_step.options for plan_step in plan.steps])
+                recorder = PriceEndpointRecorder(page) if learn else None
 
                 # Execute steps
-                steps = domain_config['categories'][category]['steps']
-                for step in steps:
-                    step_type = step['type']
-                    
-                    if step_type == 'select':
-                        await self._handle_select(page, step, dimensions)
-                    elif step_type == 'input':
-                        await self._handle_input(page, step, dimensions)
-                    elif step_type == 'click':
-                        await self._handle_click(page, step)
-                    elif step_type == 'wait':
-                        await self._handle_wait(step)
-                    elif step_type == 'blur':
-                        await self._handle_blur(page, step)
-                    elif step_type == 'captcha':
-                        await self._handle_captcha(page, step)
-                    elif step_type == 'read_price':
-                        price = await self._handle_read_price(page, step)
-                        
+                for index in range(len(plan)):
+                    if storage_state and index < setup_steps:
+                        continue
+
+                    if index in settle_watches:
+                        await price_settle.install(page, settle_watches[index])
+
+                    step, substitutions = run.step(index)
+                    self._report_substitutions(step, substitutions)
+                    price = await self._execute_step(page, step, index, dimensions, domain)
+                    if index in settle_watches and step.get('skipped'):
+                        await price_settle.discard(page)
+                    if step['type'] == 'read_price':
+                        if har:
+                            await har.capture(page)
+                        if recorder:
+                            try:
+                                await self._learn_price_request(domain, category, recorder, price, run, step)
+                            except Exception as e:
+                                self._update_status(f"Could not learn the price request: {str(e)}", "warn")
+
                         # Convert price based on VAT
-                        vat_rate = country_info['vat_rate']
-                        if step.get('includes_vat', False):
-                            price_excl = price / (1 + vat_rate/100)
-                            price_incl = price
-                        else:
-                            price_excl = price
-                            price_incl = price * (1 + vat_rate/100)
+                        price_excl, price_incl = self._apply_vat(price, step.get('includes_vat', False), country_info)
 
+                        self._report_network_usage(domain, page)
+                        await self._report_memory_usage(domain, page)
+                        self._report_timings()
                         self._update_status(
                             "Price calculation completed",
                             "complete",
@@ -141,17 +441,425 @@ class PriceCalculator:
                         )
                         
                         return price_excl, price_incl
-                    elif step_type == 'modify_element':
-                        await self._handle_modify(page, step)
+
+                    # Capture cookies and localStorage once the setup steps are done
+                    if snapshot_settings and not storage_state and index == setup_steps - 1:
+                        self.storage_states.save(domain, category, fingerprint, await page.context.storage_state())
 
             except Exception as e:
-                self._update_status(f"Error: {str(e)}", "error")
-                raise
+                if page is not None:
+                    self._report_network_usage(domain, page)
+                    await self._report_memory_usage(domain, page)
+                    self._report_timings()
+                    if har:
+                        await har.capture(page)
+                # Running out of time or memory says nothing about the snapshot
+                if not storage_state or isinstance(e, (deadline.DeadlineExceeded, MemoryPressureError)):
+                    self._update_status(f"Error: {str(e)}", "error")
+                    raise
+                # The snapshot may have gone stale, capture a new one with a full run
+                self._update_status(f"Run from session state failed, retrying with setup steps: {str(e)}", "warn")
+                self.storage_states.invalidate(domain, category)
+
+        if storage_state:
+            return await self._run_steps(url, domain, domain_config, category, dimensions, country_info, use_snapshot=False, learn=learn, version=version)
+
+        raise ValueError("No price found in configuration steps")
+
+    async def record_har(self, url: str, dimensions: Dict[str, float], country: str = 'nl', category: str = 'square_meter_price') -> Dict[str, Any]:
+        """Run the steps of a category and store all network traffic in a HAR archive.
+
+        The archive, the price, the configuration the steps ran with and the storage state
+        are kept per domain and category, so `replay_har` can run the same steps offline
+        later, without the database and unaffected by later edits of the configuration.
+        """
+        domain, domain_config, country_info, version = self._load_config(url, country, category)
+        domain_config = har_archive.offline_config(domain_config, category)
+        session = self.har_archive.recording(domain, category)
+        token = har_archive.set_session(session)
+        try:
+            # The archive is written when the context closes at the end of the run
+            price_excl, price_incl = await self._run_steps(url, domain, domain_config, category, dimensions, country_info, version=version)
+        finally:
+            har_archive.reset_session(token)
+
+        run = {
+            "url": url,
+            "country": country,
+            "dimensions": dimensions,
+            "domain_config": domain_config,
+            "country_info": country_info,
+            "price_excl_vat": price_excl,
+            "price_incl_vat": price_incl
+        }
+        self.har_archive.save_run(domain, category, run, session)
+        self._update_status(f"Recorded HAR archive for {domain}/{category}", "config", {"path": session.har_path})
+        return run
+
+    async def replay_har(self, url: str, category: str = 'square_meter_price') -> Tuple[float, float]:
+        """Run the recorded steps of a category against its HAR archive without network or database access"""
+        domain = self._normalize_domain(url)
+        run = self.har_archive.load_run(domain, category)
+        if 'domain_config' not in run:
+            raise ValueError(f"The recording of {domain}/{category} does not contain its configuration, record it again")
+        session = self.har_archive.replaying(domain, category)
+
+        token = har_archive.set_session(session)
+        try:
+            return await self._run_steps(run['url'], domain, run['domain_config'], category, run['dimensions'], run['country_info'])
+        finally:
+            har_archive.reset_session(token)
+
+    def _apply_run_settings(self, stack: AsyncExitStack, domain_config: Dict[str, Any]):
+        """Use the turbo and wait settings of a domain until `stack` is closed"""
+        # Shorter delays after actions when animations are switched off on the page
+        turbo = turbo_mode.turbo_settings(domain_config)
+        delay_token = turbo_mode.set_delay_factor(float(turbo['delay_factor']) if turbo else 1.0)
+        stack.callback(turbo_mode.reset_delay_factor, delay_token)
+        # Wait for the page after actions instead of sleeping, unless the domain opts out
+        wait_token = waits.set_settings(waits.wait_settings(domain_config))
+        stack.callback(waits.reset_settings, wait_token)
+
+    def _report_substitutions(self, step: Dict[str, Any], substitutions: List[Tuple[str, Any]]):
+        """Report the dimensions that were filled in to a step"""
+        for key, value in substitutions:
+            self._update_status(
+                f"Setting {key} to {value}",
+                step['type'],
+                {
+                    "selector": step.get('selector'),
+                    "value": str(value),
+                    "unit": step.get('unit', 'mm')
+                }
+            )
+
+    async def _execute_step(self, page: Page, step: Dict[str, Any], index: int, dimensions: Dict[str, float], domain: str) -> Optional[float]:
+        """Execute one step through the step registry, returns the price for read_price steps"""
+        return await self.steps.execute(StepCall(page, step, index, dimensions, domain))
+
+    async def _preflight(self, page: Page, url: str, plan: StepPlan, category_config: Dict[str, Any], start: int = 0):
+        """Check the selectors of all steps in one evaluation, fails when a step marked `upfront` has no element"""
+        settings = preflight.preflight_settings(category_config)
+        if not settings:
+            return
+        results = await preflight.check(page, plan, start)
+        counts = {state: sum(result['state'] == state for result in results)
+                  for state in (preflight.VISIBLE, preflight.HIDDEN, preflight.MISSING, preflight.UNCHECKED)}
+        self._update_status(
+            f"Preflight: {counts[preflight.VISIBLE]} visible, {counts[preflight.HIDDEN]} hidden, {counts[preflight.MISSING]} missing",
+            "preflight",
+            {"steps": results, **counts}
+        )
+        problem = preflight.diagnose(results, url)
+        if problem and settings['fail_on_missing']:
+            raise ValueError(problem)
+        if problem:
+            self._update_status(problem, "warn")
+
+    async def _pick_selector(self, call: StepCall):
+        """Replace the selector of a step with a fallback chain by the candidate that matches"""
+        selectors = selector_chain.candidates(call.step)
+        if not selectors:
+            return
+        ordered = self.selector_stats.order(call.domain, selectors)
+        try:
+            winner = await selector_chain.race(call.page, ordered)
+        except ValueError:
+            self.selector_stats.record(call.domain, selectors, ordered, None)
+            raise
+        self.selector_stats.record(call.domain, selectors, ordered, winner)
+        if winner != selectors[0]:
+            self._update_status(f"Using fallback selector {winner}", "config", {"selector": winner, "candidates": selectors})
+        call.step['selector'] = winner
+
+    def _skip_step(self, step: Dict[str, Any], message: str):
+        """Report a step whose element already holds the target value as skipped"""
+        step_registry.mark_skipped()
+        # Tells the run that a price watcher installed for this step expects a change in vain
+        step['skipped'] = True
+        self._update_status(f"{message}, step skipped", step['type'], {"selector": step.get('selector'), "skipped": True})
+
+    def _report_timings(self):
+        """Report the time spent in each step of this run"""
+        timings = step_registry.current_timings()
+        if timings and timings.steps:
+            self._update_status("Step timings", "timing", timings.as_dict())
+
+    def sweep_prices(self, url: str, dimension_sets: List[Dict[str, float]], country: str = 'nl',
+                     category: str = 'square_meter_price') -> AsyncIterator[Dict[str, Any]]:
+        """Read the prices of many dimension sets on one page and yield each result once it is read.
+
+        The first set runs all steps. Later sets only run the steps whose templated value
+        differs from the previous set, steps marked with `repeat_in_sweep` and the
+        read_price step. After a failed set the page is reloaded and the next set runs all
+        steps again. A result is a dict with the index and dimensions of the set and either
+        the prices or an error.
+        """
+        return self._in_own_task(self._sweep_prices(url, dimension_sets, country, category))
+
+    async def _sweep_prices(self, url: str, dimension_sets: List[Dict[str, float]], country: str,
+                            category: str) -> AsyncIterator[Dict[str, Any]]:
+        domain, domain_config, country_info, version = self._load_config(url, country, category)
+        steps = domain_config['categories'][category].get('steps')
+        if not steps:
+            raise ValueError(f"Category '{category}' of {domain} has no steps to sweep")
+        plan = self.plans.get(domain, category, steps, version)
+        settle_watches = self._settle_watches([plan_step.options for plan_step in plan.steps])
+
+        self._update_status(f"Starting price sweep of {len(dimension_sets)} dimension sets for {domain}", "config", {"domain": domain})
+        async with AsyncExitStack() as stack:
+            self._apply_run_settings(stack, domain_config)
+            page = await self._acquire_page(stack, url, domain, domain_config)
+            await self._preflight(page, url, plan, domain_config['categories'][category])
+
+            previous = None
+            for number, dimensions in enumerate(dimension_sets, 1):
+                run = ExecutionContext(plan, dimensions, self._convert_value)
+                try:
+                    price, price_step = await self._sweep_step(page, run, previous, settle_watches, domain)
+                except Exception as e:
+                    self._update_status(f"Sweep set {number}/{len(dimension_sets)} failed: {str(e)}", "warn", {"dimensions": dimensions})
+                    yield {"index": number - 1, "dimensions": dimensions, "error": str(e)}
+                    # The state of the form is unknown, start over with all steps
+                    previous = None
+                    await page.goto(url, timeout=120000)
+                    await page.wait_for_load_state('networkidle')
+                    continue
+
+                price_excl, price_incl = self._apply_vat(price, price_step.get('includes_vat', False), country_info)
+                self._update_status(f"Sweep set {number}/{len(dimension_sets)}: €{price_excl:.2f}", "read_price", {"dimensions": dimensions})
+                yield {"index": number - 1, "dimensions": dimensions, "price_excl_vat": price_excl, "price_incl_vat": price_incl}
+                previous = run
+
+            self._report_network_usage(domain, page)
+            await self._report_memory_usage(domain, page)
+        self._update_status("Price sweep completed", "complete", {"sets": len(dimension_sets)})
+
+    def fork_prices(self, url: str, dimension_sets: List[Dict[str, float]], country: str = 'nl',
+                    category: str = 'square_meter_price', parallel: int = 4) -> AsyncIterator[Dict[str, Any]]:
+        """Read the prices of many dimension sets in parallel contexts that start after the shared steps.
+
+        The leading steps without a dimension placeholder run once. The cookies and
+        localStorage they leave and the URL they end on form a checkpoint from which every
+        set continues in its own context, at most `parallel` at a time. State that only lives
+        in the DOM of the page is not part of the checkpoint. Results have the same form as
+        those of `sweep_prices` and are yielded in the order they finish.
+        """
+        return self._in_own_task(self._fork_prices(url, dimension_sets, country, category, parallel))
+
+    async def _fork_prices(self, url: str, dimension_sets: List[Dict[str, float]], country: str,
+                           category: str, parallel: int) -> AsyncIterator[Dict[str, Any]]:
+        domain, domain_config, country_info, version = self._load_config(url, country, category)
+        steps = domain_config['categories'][category].get('steps')
+        if not steps:
+            raise ValueError(f"Category '{category}' of {domain} has no steps to run")
+        plan = self.plans.get(domain, category, steps, version)
+        prefix = plan.prefix_length()
+        settle_watches = self._settle_watches([plan_step.options for plan_step in plan.steps])
+
+        self._update_status(f"Running {prefix} shared steps once for {len(dimension_sets)} dimension sets", "config", {"domain": domain})
+        async with AsyncExitStack() as stack:
+            self._apply_run_settings(stack, domain_config)
+
+            # Run the shared steps and keep what they left behind
+            async with AsyncExitStack() as prefix_stack:
+                page = await self._acquire_page(prefix_stack, url, domain, domain_config)
+                await self._preflight(page, url, plan, domain_config['categories'][category])
+                run = ExecutionContext(plan, dimension_sets[0], self._convert_value)
+                for index in range(prefix):
+                    step, _ = run.step(index)
+                    await self._execute_step(page, step, index, run.dimensions, domain)
+                checkpoint_url = page.url
+                storage_state = await page.context.storage_state()
+            self._update_status(f"Checkpoint taken at {checkpoint_url}", "config", {"url": checkpoint_url, "parallel": parallel})
+
+            semaphore = asyncio.Semaphore(max(1, parallel))
+
+            async def fork(index: int, dimensions: Dict[str, float]) -> Dict[str, Any]:
+                async with semaphore:
+                    run = ExecutionContext(plan, dimensions, self._convert_value)
+                    try:
+                        async with AsyncExitStack() as fork_stack:
+                            page = await self._open_page(fork_stack, checkpoint_url, domain_config, report_status=False, storage_state=storage_state)
+                            price, price_step = await self._sweep_step(page, run, None, settle_watches, domain, start=prefix)
+                            self._report_network_usage(domain, page)
+                    except Exception as e:
+                        self._update_status(f"Set {index + 1}/{len(dimension_sets)} failed: {str(e)}", "warn", {"dimensions": dimensions})
+                        return {"index": index, "dimensions": dimensions, "error": str(e)}
+
+                    price_excl, price_incl = self._apply_vat(price, price_step.get('includes_vat', False), country_info)
+                    self._update_status(f"Set {index + 1}/{len(dimension_sets)}: €{price_excl:.2f}", "read_price", {"dimensions": dimensions})
+                    return {"index": index, "dimensions": dimensions, "price_excl_vat": price_excl, "price_incl_vat": price_incl}
+
+            # Tasks copy the run settings of this context
+            tasks = [asyncio.create_task(fork(index, dimensions)) for index, dimensions in enumerate(dimension_sets)]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield await finished
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        self._update_status("Price sweep completed", "complete", {"sets": len(dimension_sets)})
+
+    async def _in_own_task(self, results: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Run an async generator in a task of its own and yield what it yields.
+
+        The generators set the run settings, which are context variables, and keep them
+        until they finish. Driven directly, every resumption runs in the context of whoever
+        iterates, which can differ between chunks of a streamed response, so the settings
+        would leak into the caller and could not be reset. In a task they are set and reset
+        in one context.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        finished = object()
+
+        async def produce():
+            try:
+                async for result in results:
+                    await queue.put((result, None))
+                await queue.put((finished, None))
+            except Exception as e:
+                await queue.put((finished, e))
             finally:
-                await browser.close()
+                # Also when cancelled while waiting for the consumer
+                await results.aclose()
 
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                result, error = await queue.get()
+                if result is finished:
+                    if error:
+                        raise error
+                    return
+                yield result
+        finally:
+            # Cancelling the task closes the generator inside it
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _sweep_step(self, page: Page, run: ExecutionContext, previous: Optional[ExecutionContext],
+                          settle_watches: Dict[int, Union[str, List[str]]], domain: str, start: int = 0) -> Tuple[float, Dict[str, Any]]:
+        """Run the steps of one sweep set from `start` up to the first read_price step, returns the price and that step"""
+        if previous is None:
+            indexes = range(start, len(run.plan))
+        else:
+            changed = set(run.changed_steps(previous))
+            indexes = [index for index, plan_step in enumerate(run.plan.steps)
+                       if index in changed or plan_step.type == 'read_price' or plan_step.options.get('repeat_in_sweep')]
+            # The price starts changing with the first action of this set
+            actions = [index for index in indexes if run.plan.steps[index].type not in ('wait', 'read_price')]
+            price_step = next((run.plan.steps[index] for index in indexes if run.plan.steps[index].type == 'read_price'), None)
+            settle_watches = {}
+            if actions and price_step and price_settle.settle_settings(price_step.options):
+                settle_watches[actions[0]] = price_step.options.get('selector_candidates') or price_step.selector
+
+        for index in indexes:
+            if index in settle_watches:
+                await price_settle.install(page, settle_watches[index])
+            step, substitutions = run.step(index)
+            self._report_substitutions(step, substitutions)
+            price = await self._execute_step(page, step, index, run.dimensions, domain)
+            if index in settle_watches and step.get('skipped'):
+                await price_settle.discard(page)
+            if step['type'] == 'read_price':
+                return price, step
         raise ValueError("No price found in configuration steps")
 
+    def _settle_watches(self, steps: List[Dict[str, Any]]) -> Dict[int, Union[str, List[str]]]:
+        """Map the index of the last action before each settling read_price step to its price selector or chain"""
+        watches = {}
+        for index, step in enumerate(steps):
+            if step['type'] != 'read_price' or not price_settle.settle_settings(step):
+                continue
+            for previous in range(index - 1, -1, -1):
+                if steps[previous]['type'] not in ('wait', 'read_price'):
+                    watches[previous] = step.get('selector_candidates') or step['selector']
+                    break
+        return watches
+
+    def _report_network_usage(self, domain: str, page: Page):
+        """Report requests and bytes received and saved by the network profile for this run"""
+        stats = self.network_monitor.stats_for(page.context)
+        if stats:
+            self.network_monitor.finish_run(domain, stats)
+            self._update_status("Network usage", "network", stats.as_dict())
+
+    async def _report_memory_usage(self, domain: str, page: Page):
+        """Report the JS heap of the page and the memory of its browser for this run"""
+        try:
+            measurement = await self.browser_pool.measure_run(page, domain)
+        except Exception as e:
+            logging.warning(f"Could not measure memory usage: {str(e)}")
+            return
+        self._update_status("Memory usage", "memory", measurement)
+
+    async def _acquire_page(self, stack: AsyncExitStack, url: str, domain: str, domain_config: Dict[str, Any], storage_state: Dict[str, Any] = None) -> Page:
+        """Get a page on the product URL, either pre-loaded from the warm pool or freshly opened"""
+        deadline.set_activity(f"opening {url}")
+        warm_settings = domain_config.get('warm_pool')
+        # Pre-loaded pages start without session state, so they cannot skip setup steps
+        if warm_settings and warm_settings.get('enabled', True) and not storage_state:
+            warm_page = self.warm_pool.take(domain, url, domain_config, self._open_page)
+            if warm_page:
+                stack.push_async_callback(warm_page.close)
+                warm_page.page.set_default_timeout(deadline.timeout(120000))  # 120 seconds, or the time left for the calculation
+                self._update_status("Using pre-loaded page", "loaded", {"url": url, "age": warm_page.age})
+                return warm_page.page
+
+        return await self._open_page(stack, url, domain_config, storage_state=storage_state)
+
+    async def _open_page(self, stack: AsyncExitStack, url: str, domain_config: Dict[str, Any], report_status: bool = True, storage_state: Dict[str, Any] = None) -> Page:
+        """Open a fresh context on one of the pooled browsers and load the product page.
+
+        The context is closed when `stack` is closed.
+        """
+        profile = browser_profile(domain_config)
+        har = har_archive.current()
+        context = await stack.enter_async_context(self.browser_pool.context(
+            engine=profile['engine'],
+            launch_args=profile['args'],
+            storage_state=storage_state,
+            **context_options(profile),
+            **(har.context_options() if har else {})
+        ))
+
+        # Serve static scripts and stylesheets from the shared disk cache. Routes run in
+        # reverse order of registration, so blocked requests never reach the cache.
+        cache_settings = domain_config.get('asset_cache') or {}
+        if self.asset_cache and cache_settings.get('enabled', True):
+            await self.asset_cache.install(context, self._normalize_domain(url))
+
+        # Block heavy resources and count network usage for this context
+        await self.network_monitor.attach(context, domain_config)
+
+        # A replayed run answers every request that is not blocked from its HAR archive
+        if har:
+            await har.install(context)
+
+        # Switch off animations, transitions and smooth scrolling before any page script runs
+        turbo = turbo_mode.turbo_settings(domain_config)
+        if turbo:
+            await turbo_mode.install(context, turbo)
+
+        # Create page from context and set timeout
+        page = await context.new_page()
+        page.set_default_timeout(deadline.timeout(120000))  # 120 seconds, or the time left for the calculation
+        waits.track_requests(page)
+
+        # Navigate to URL with increased timeout
+        if report_status:
+            self._update_status(f"Navigating to {url}", "navigation", {"url": url})
+        await page.goto(url, timeout=deadline.timeout(120000))  # 120 seconds, or the time left for the calculation
+        if report_status:
+            self._update_status("Waiting for page to be fully loaded", "loading")
+        await page.wait_for_load_state('networkidle')
+        if report_status:
+            self._update_status("Page loaded successfully", "loaded")
+            await page.wait_for_timeout(100)  # Small delay to ensure status is sent
+        return page
+
     def _convert_value(self, value: float, unit: str) -> float:
         """Convert a value from millimeters to the target unit"""
         # Convert value to float if it's an integer
@@ -162,35 +870,7 @@ class PriceCalculator:
         return value  # Default is mm
 
     async def _handle_select(self, page, step, dimensions):
-        """Handle a select/input step"""
-        # Controleer eerst of 'value' aanwezig is in de step dictionary
-        if 'value' not in step:
-            # Als use_index is ingesteld en option_index is beschikbaar, gebruik index gebaseerde selectie
-            if 'use_index' in step and step['use_index'] and 'option_index' in step:
-                # Voeg automatisch een value toe in het juiste format
-                step['value'] = f"index:{step['option_index']}"
-                self._update_status(f"Added value 'index:{step['option_index']}' based on option_index", "select")
-            # Als er geen selector is, probeer opties te raden op basis van andere velden
-            elif 'selector' in step:
-                # Log dit als een waarschuwing en gebruik een default waarde
-                self._update_status(f"No value specified for select step, using empty value", "warn")
-                step['value'] = ""  # Lege string als fallback
-            else:
-                # Als er geen selector is, kunnen we niet verder
-                self._update_status("Missing required fields for select step", "error")
-                raise ValueError("Missing required fields in select step: need 'value' or 'use_index' + 'option_index'")
-        
-        # Controleer of de selector aanwezig is
-        if 'selector' not in step:
-            if 'select_element' in step:
-                # Als select_element aanwezig is, gebruik dat als selector (compatibiliteit met index selectie)
-                step['selector'] = step['select_element']
-                self._update_status(f"Using select_element as selector", "select")
-            else:
-                # Als er geen selector is, kunnen we niet verder
-                self._update_status("No selector specified for select step", "error")
-                raise ValueError("Missing required field 'selector' in select step")
-        
+        """Handle a select/input step, the step plan has filled in `value` and `selector`"""
         value = step['value']
         selector = step['selector']
         
@@ -203,13 +883,19 @@ class PriceCalculator:
                 self._update_status(f"Selecting option with index {index}", "select", {"selector": selector, "index": index})
                 
                 # Find the select element
-                element = await page.wait_for_selector(selector, timeout=5000)
+                element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))
                 if not element:
                     raise ValueError(f"No element found matching selector: {selector}")
+
+                if step.get('skip_if_set', True):
+                    selected = await element.evaluate(SELECTED_OPTION_SCRIPT)
+                    if selected and selected['index'] == index:
+                        self._skip_step(step, f"Option {index} of {selector} is already selected")
+                        return
                 
                 # Ensure the element is visible
                 await element.scroll_into_view_if_needed()
-                await asyncio.sleep(0.5)
+                await waits.actionable(element, step, 0.5)
                 
                 # Check if it's a standard SELECT element
                 tag_name = await element.evaluate('el => el.tagName.toLowerCase()')
@@ -219,11 +905,11 @@ class PriceCalculator:
                     if index < len(options):
                         # Select the option by index
                         await element.click()  # Click to open dropdown
-                        await asyncio.sleep(0.2)
+                        await waits.legacy_pause(step, 0.2)
                         # Get the option value at the specified index
                         option_value = options[index]
                         await element.select_option(value=option_value)
-                        await asyncio.sleep(0.5)
+                        await waits.settled(page, step, 0.5, element=element, value=option_value)
                         await element.evaluate('(el) => el.dispatchEvent(new Event("change", { bubbles: true }))')
                         return
                     else:
@@ -231,7 +917,7 @@ class PriceCalculator:
                 else:
                     # For non-standard dropdowns, try to find all options and click the one at the specified index
                     await element.click()  # Click to open dropdown
-                    await asyncio.sleep(0.5)
+                    await waits.settled(page, step, 0.5, element=element)
                     
                     # Try to find options (this depends on the site's structure)
                     options = await page.query_selector_all('li, .option, .dropdown-item, [role="option"]')
@@ -272,13 +958,13 @@ class PriceCalculator:
                                 }}
                             }}
                         ''', selector, index)
-                        await asyncio.sleep(1)
+                        await waits.settled(page, step, 1)
                         return
                     
                     # Click the option at the specified index
                     if index < len(options):
                         await options[index].click()
-                        await asyncio.sleep(0.5)
+                        await waits.settled(page, step, 0.5)
                         return
                     else:
                         raise ValueError(f"Index {index} is out of range for dropdown with {len(options)} options")
@@ -290,7 +976,7 @@ class PriceCalculator:
         # Value is een lege string, probeer de eerste optie te selecteren
         if value == "":
             try:
-                element = await page.wait_for_selector(selector, timeout=5000)
+                element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))
                 if not element:
                     self._update_status(f"Element not found: {selector}", "error")
                     return  # Ga verder zonder error
@@ -300,43 +986,23 @@ class PriceCalculator:
                     # Voor select elementen, selecteer de eerste optie
                     await element.select_option(index=0)
                     self._update_status(f"Selected first option for empty value", "select")
-                    await asyncio.sleep(0.5)
+                    await waits.settled(page, step, 0.5, element=element)
                     return
                 else:
                     # Voor non-standard dropdowns, klik erop en selecteer de eerste optie
                     await element.click()
-                    await asyncio.sleep(0.5)
+                    await waits.settled(page, step, 0.5, element=element)
                     options = await page.query_selector_all('li, .option, .dropdown-item, [role="option"]')
                     if options and len(options) > 0:
                         await options[0].click()
                         self._update_status(f"Selected first dropdown option for empty value", "select")
-                        await asyncio.sleep(0.5)
+                        await waits.settled(page, step, 0.5)
                         return
             except Exception as e:
                 self._update_status(f"Error selecting first option: {str(e)}", "warn")
                 # Ga verder met reguliere selectie
         
-        # Handle regular value-based selection
-        for key in ['thickness', 'width', 'length']:
-            if f"{{{key}}}" in value:
-                if key in dimensions:
-                    converted_value = self._convert_value(dimensions[key], step.get('unit', 'mm'))
-                    if isinstance(converted_value, float) and converted_value.is_integer():
-                        converted_value = int(converted_value)
-                    value = value.replace(f"{{{key}}}", str(converted_value))
-                    self._update_status(
-                        f"Setting {key} to {converted_value}",
-                        "select",
-                        {
-                            "selector": selector,
-                            "value": str(converted_value),
-                            "unit": step.get('unit', 'mm')
-                        }
-                    )
-                else:
-                    self._update_status(f"Dimension {key} not found", "error")
-                    raise ValueError(f"Dimension {key} not found in dimensions dict")
-        
+        # Handle regular value-based selection, the dimensions are filled in by the step plan
         logging.info(f"Handling select/input: {selector} with target value {value}")
         self._update_status(f"Handling select/input with value {value}", "select", {"selector": selector, "value": value})
         
@@ -346,20 +1012,26 @@ class PriceCalculator:
             # If we can't convert to float, treat it as a string-based selection
             self._update_status(f"Using string-based selection with value: {value}", "select")
             
-            element = await page.wait_for_selector(selector, timeout=5000)
+            element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))
             if not element:
                 raise ValueError(f"No element found matching selector: {selector}")
+
+            if step.get('skip_if_set', True):
+                selected = await element.evaluate(SELECTED_OPTION_SCRIPT)
+                if selected and selected['text'] == value.strip():
+                    self._skip_step(step, f"Option {value} of {selector} is already selected")
+                    return
                 
             tag_name = await element.evaluate('el => el.tagName.toLowerCase()')
             if tag_name == 'select':
                 # For select elements, try to find option with matching text
                 await element.select_option(label=value)
-                await asyncio.sleep(0.5)
+                await waits.settled(page, step, 0.5, element=element)
                 return
             else:
                 # For non-standard dropdowns, try to find an option containing the text
                 await element.click()  # Click to open dropdown
-                await asyncio.sleep(0.5)
+                await waits.settled(page, step, 0.5, element=element)
                 
                 # Try to find options with matching text
                 options = await page.query_selector_all('li, .option, .dropdown-item, [role="option"]')
@@ -367,7 +1039,7 @@ class PriceCalculator:
                     option_text = await option.text_content()
                     if value.lower() in option_text.lower():
                         await option.click()
-                        await asyncio.sleep(0.5)
+                        await waits.settled(page, step, 0.5)
                         return
                 
                 raise ValueError(f"No option found with text containing '{value}'")
@@ -377,131 +1049,61 @@ class PriceCalculator:
             trigger = await page.wait_for_selector(step['container_trigger'])
             if trigger:
                 await trigger.click()
-                await asyncio.sleep(0.5)
+                await waits.settled(page, step, 0.5, element=trigger)
 
-        # Find all matching elements
-        elements = await page.query_selector_all(selector)
-        if not elements:
+        # Read all candidates in the page and pick the closest one there
+        result = await page.eval_on_selector_all(selector, SELECT_CANDIDATES_SCRIPT, target_value)
+        candidates = result['candidates']
+        if not candidates:
             raise ValueError(f"No elements found matching selector: {selector}")
+        for candidate in candidates:
+            logging.debug(f"Select candidate {candidate}")
 
-        best_match = None
-        smallest_diff = float('inf')
-
-        # Try each element
-        for element in elements:
-            try:
-                # Get element type
-                tag_name = await element.evaluate('el => el.tagName.toLowerCase()')
-                element_type = await element.get_attribute('type') if tag_name == 'input' else None
-
-                # Get the value and any associated text
-                value_attr = await element.get_attribute('value')
-                element_text = ''
-
-                if tag_name == 'select':
-                    # For select elements, get all options
-                    options = await element.evaluate('''(select) => {
-                        return Array.from(select.options).map(option => ({
-                            value: option.value,
-                            text: option.text.trim()
-                        }));
-                    }''')
-                    
-                    for option in options:
-                        try:
-                            numeric_match = re.search(r'(\d+(?:\.\d+)?)', option['text'])
-                            if numeric_match:
-                                option_value = float(numeric_match.group(1))
-                                diff = abs(option_value - target_value)
-                                if diff < smallest_diff:
-                                    smallest_diff = diff
-                                    best_match = {
-                                        'element': element,
-                                        'type': 'select',
-                                        'value': option['value'],
-                                        'option_value': option_value
-                                    }
-                        except Exception as e:
-                            logging.error(f"Error processing select option: {str(e)}")
-
-                elif element_type in ['radio', 'checkbox']:
-                    try:
-                        # Get numeric value from the value attribute
-                        numeric_match = re.search(r'(\d+(?:\.\d+)?)', value_attr)
-                        if numeric_match:
-                            option_value = float(numeric_match.group(1))
-                            diff = abs(option_value - target_value)
-                            logging.info(f"Found radio/checkbox with value {option_value} (target: {target_value}, diff: {diff})")
-                            if diff < smallest_diff:
-                                smallest_diff = diff
-                                best_match = {
-                                    'element': element,
-                                    'type': 'input',
-                                    'option_value': option_value
-                                }
-                    except Exception as e:
-                        logging.error(f"Error processing radio/checkbox: {str(e)}")
-
-                else:
-                    # For other elements, try to find numeric value in text content
-                    element_text = await element.text_content()
-                    numeric_match = re.search(r'(\d+(?:\.\d+)?)', element_text)
-                    if numeric_match:
-                        option_value = float(numeric_match.group(1))
-                        diff = abs(option_value - target_value)
-                        if diff < smallest_diff:
-                            smallest_diff = diff
-                            best_match = {
-                                'element': element,
-                                'type': 'other',
-                                'option_value': option_value
-                            }
-
-            except Exception as e:
-                logging.error(f"Error processing element: {str(e)}")
-                continue
+        best_match = result['best']
+        smallest_diff = best_match['diff'] if best_match else float('inf')
 
         # Select the best matching option
         if best_match and smallest_diff < 0.01:  # Strict matching threshold
-            logging.info(f"Found best match with value {best_match.get('option_value')} (diff: {smallest_diff})")
-            
+            logging.info(f"Found best match with value {best_match.get('option_value')} (diff: {smallest_diff}, "
+                         f"{len(candidates)} candidates)")
+            if best_match['selected'] and step.get('skip_if_set', True):
+                self._skip_step(step, f"Option {best_match['text'] or best_match['value']} of {selector} is already selected")
+                return
+            element = await page.locator(selector).nth(best_match['index']).element_handle()
+
             # Ensure element is in view and clickable
-            await best_match['element'].scroll_into_view_if_needed()
-            await asyncio.sleep(0.5)  # Wait for scroll to complete
-            
-            if best_match['type'] == 'select':
+            await element.scroll_into_view_if_needed()
+            await waits.actionable(element, step, 0.5)
+
+            if best_match['kind'] == 'select':
                 # For select elements, first click to open dropdown
-                await best_match['element'].click()
-                await asyncio.sleep(0.2)
+                await element.click()
+                await waits.legacy_pause(step, 0.2)
                 # Then select the option
-                await best_match['element'].select_option(value=best_match['value'])
+                await element.select_option(value=best_match['value'])
                 # Finally click again to close dropdown
-                await best_match['element'].click()
+                await element.click()
             else:
                 # For radio/checkbox/other, simulate a real click
                 # First ensure we're clicking the center of the element
-                box = await best_match['element'].bounding_box()
+                box = await element.bounding_box()
                 if box:
                     x = box['x'] + box['width'] / 2
                     y = box['y'] + box['height'] / 2
                     await page.mouse.click(x, y)
                 else:
                     # Fallback to element click if we can't get bounding box
-                    await best_match['element'].click()
-            
+                    await element.click()
+
             # Dispatch change event
-            await best_match['element'].evaluate('(el) => el.dispatchEvent(new Event("change", { bubbles: true }))')
-            await asyncio.sleep(1)
+            await element.evaluate('(el) => el.dispatchEvent(new Event("change", { bubbles: true }))')
+            await waits.settled(page, step, 1, element=element)
             return
         else:
+            self._update_status(f"No option matches value {value}", "error", {"selector": selector, "candidates": candidates})
             raise ValueError(f"Could not find matching option for value {value}mm (closest diff was {smallest_diff})")
 
-    async def _handle_input(self, page, step, dimensions):
-        # Check eerst of 'selector' aanwezig is
-        if 'selector' not in step:
-            self._update_status(f"Missing selector in input step", "error")
-            raise ValueError("No selector specified for input step")
-            
+    async def _handle_input(self, page, step, dimensions, domain: str = None):
         selector = step['selector']
         max_retries = 3
         clear_first = step.get('clear_first', True)  # Default to clearing the field first
@@ -529,8 +1131,8 @@ class PriceCalculator:
                 parts = [random.choice(first_names), random.choice(last_names), random.choice(numbers)]
                 random.shuffle(parts)
                 email_name = '.'.join(parts[:2])
-                domain = random.choice(domains)
-                step['value'] = f"{email_name}@{domain}"
+                email_domain = random.choice(domains)
+                step['value'] = f"{email_name}@{email_domain}"
                 self._update_status(f"Using random email: {step['value']}", "input", {"selector": selector, "value": step['value']})
             elif random_type == 'Password':
                 # Haal wachtwoordinstellingen op uit stap
@@ -656,74 +1258,64 @@ class PriceCalculator:
                 terms = ['test', 'sample', 'example', 'demo', 'trial', 'preview', 'beta', 'review', 'check', 'verify']
                 step['value'] = random.choice(terms)
                 self._update_status(f"Using random term: {step['value']}", "input", {"selector": selector, "value": step['value']})
-        else:
-            # Check of 'value' aanwezig is als we niet randomizen
-            if 'value' not in step:
-                self._update_status(f"No value specified for input step, using empty string", "warn")
-                step['value'] = ""  # Gebruik lege string als fallback
-            else:
-                # Originele waarde uit stap
-                step['value'] = step['value']
-                
-                # Variabelen in de value string vervangen door waarden uit dimensions
-        for key in ['thickness', 'width', 'length', 'quantity']:
-            if f"{{{key}}}" in step['value']:
-                if key in dimensions:
-                    converted_value = self._convert_value(dimensions[key], step.get('unit', 'mm'))
-                    # Convert to integer if it's a whole number
-                    if isinstance(converted_value, float) and converted_value.is_integer():
-                        converted_value = int(converted_value)
-                    step['value'] = step['value'].replace(f"{{{key}}}", str(converted_value))
-                    self._update_status(
-                        f"Setting {key} to {converted_value}",
-                        "input",
-                        {
-                            "selector": selector,
-                            "value": str(converted_value),
-                            "unit": step.get('unit', 'mm')
-                        }
-                    )
-                else:
-                    self._update_status(f"Dimension {key} not found", "error")
-                    raise ValueError(f"Dimension {key} not found in dimensions dict")
 
+        # Variabelen in de value string zijn al vervangen door het stappenplan
         logging.info(f"Handling input: {selector} with value {step['value']}")
         self._update_status(f"Setting input value {step['value']}", "input", {"selector": selector, "value": step['value']})
+
+        # Warm pages and restored sessions often have the value filled in already
+        randomized = step.get('randomize') or step.get('input_method') == 'randomize'
+        if step.get('skip_if_set', True) and not randomized:
+            current_value = await page.evaluate(CURRENT_VALUE_SCRIPT, selector)
+            if current_value is not None and input_strategy.holds_value(current_value, step['value']):
+                self._skip_step(step, f"{selector} already holds {step['value']}")
+                return
+
+        # Try the faster strategies before typing, for `auto` the one that worked last time first
+        strategy = input_strategy.step_strategy(step)
+        order = self.input_strategies.order(domain, selector, strategy)
+        fast_strategies = order[:order.index('type')] if 'type' in order else order
+        if fast_strategies:
+            if await self._set_input_fast(page, step, domain, strategy, fast_strategies):
+                return
+            if 'type' not in order:
+                self._update_status(f"Input strategy {strategy} could not set {selector}", "error")
+                raise ValueError(f"Input strategy {strategy} could not set the value of {selector}")
         
         for attempt in range(max_retries):
             try:   
                 # Wacht langer op het element in de online omgeving
-                element = await page.wait_for_selector(selector, timeout=5000)  # 5 seconden timeout
+                element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))  # 5 seconden timeout
                 if not element:
                     raise ValueError(f"Element not found: {selector}")
                 
                 # Scroll naar het element om zeker te zijn dat het zichtbaar is
                 await element.scroll_into_view_if_needed()
-                await asyncio.sleep(0.5)
+                await waits.actionable(element, step, 0.5)
                 
                 # Focus op het element voordat we beginnen
                 await element.focus()
-                await asyncio.sleep(0.3)
+                await waits.legacy_pause(step, 0.3)
                 
                 if clear_first:
                     # Leeg het veld op verschillende manieren
                     await element.evaluate('(el) => { el.value = ""; }')
-                    await asyncio.sleep(0.3)
+                    await waits.legacy_pause(step, 0.3)
                     
                     # Selecteer alle tekst en verwijder
                     await element.click(click_count=3)  # Triple click selecteert alle tekst
-                    await asyncio.sleep(0.2)
+                    await waits.legacy_pause(step, 0.2)
                     await element.press('Backspace')
-                    await asyncio.sleep(0.2)
+                    await waits.legacy_pause(step, 0.2)
                 
                 # Type de nieuwe waarde, met korte pauzes tussen tekens
                 try:
                     # Handle passwords with special characters 
                     if step.get('random_type') == 'Password':
                         # First try with type()
-                        await element.type(str(step['value']), delay=50)
+                        await element.type(str(step['value']), delay=waits.typing_delay(step))
                     else:
-                        await element.type(str(step['value']), delay=50)
+                        await element.type(str(step['value']), delay=waits.typing_delay(step))
                     
                     # Stuur events om de website te informeren over de wijziging
                     await element.evaluate('''(el) => {
@@ -738,7 +1330,9 @@ class PriceCalculator:
                     actual_value_str = str(actual_value)
                     step_value_str = str(step['value'])
                     
-                    if actual_value_str == step_value_str or step_value_str in actual_value_str:
+                    if input_strategy.value_matches(actual_value_str, step_value_str):
+                        if strategy == input_strategy.AUTO:
+                            self.input_strategies.record(domain, selector, 'type', len(fast_strategies) + 1)
                         self._update_status(f"Successfully set input to {step_value_str if step.get('random_type') != 'Password' else '[HIDDEN]'}", "input", {"status": "success"})
                         return
                     else:
@@ -786,15 +1380,72 @@ class PriceCalculator:
                                 self._update_status(f"Character-by-character typing failed: {str(char_error)}", "error")
                 
                 # Langere wachttijd tussen acties
-                await asyncio.sleep(1.0)
+                await waits.settled(page, step, 1.0, element=element, value=step['value'])
                 
             except Exception as e:
                 self._update_status(f"Error setting input (attempt {attempt+1}/{max_retries}): {str(e)}", "warn")
                 if attempt == max_retries - 1:  # als dit de laatste poging was
                     self._update_status(f"Failed to set input after {max_retries} attempts", "error")
                     raise
+                deadline.check()
+                step_registry.count_retry()
                 await asyncio.sleep(1.0)  # wacht voor de volgende poging
 
+    async def _set_input_fast(self, page, step, domain, strategy: str, strategies: List[str]) -> bool:
+        """Set an input with each strategy in turn, True once one of them set the value"""
+        selector = step['selector']
+        value = str(step['value'])
+        element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))
+        if not element:
+            raise ValueError(f"Element not found: {selector}")
+
+        await element.scroll_into_view_if_needed()
+        await waits.actionable(element, step, 0.5)
+
+        for attempt, name in enumerate(strategies, 1):
+            try:
+                actual_value = await input_strategy.apply(element, name, value)
+            except Exception as e:
+                self._update_status(f"Input strategy {name} failed: {str(e)}", "warn")
+                continue
+
+            if input_strategy.value_matches(actual_value, value):
+                if strategy == input_strategy.AUTO:
+                    self.input_strategies.record(domain, selector, name, attempt)
+                shown = value if step.get('random_type') != 'Password' else '[HIDDEN]'
+                self._update_status(f"Successfully set input to {shown}", "input", {"status": "success", "strategy": name})
+                await waits.settled(page, step, 1.0, element=element, value=value)
+                return True
+            self._update_status(f"Input strategy {name} did not set the value", "warn", {"selector": selector, "strategy": name})
+        return False
+
+    async def _handle_fill_form(self, page, step, dimensions, domain: str = None):
+        """Set all fields of a fill_form step at once, fields that do not take the value run as input steps"""
+        fields = step['fields']
+        skip_if_set = step.get('skip_if_set', True)
+        self._update_status(f"Filling {len(fields)} fields", "input", {"fields": fields})
+
+        results = await input_strategy.fill_form(page, fields, skip_if_set)
+        if all(result['unchanged'] for result in results):
+            self._skip_step(step, f"All {len(fields)} fields already hold their values")
+            return
+
+        retry = [result for result in results if not input_strategy.field_matches(result, fields[result['selector']])]
+        if retry:
+            self._update_status(f"Filling {len(retry)} fields one by one", "warn", {"selectors": [result['selector'] for result in retry]})
+        # The options of the step, such as input_strategy and the waits, apply to every field
+        shared = {key: value for key, value in step.items() if key not in ('type', 'fields', 'selector', 'value')}
+        for result in retry:
+            step_registry.count_retry()
+            selector = result['selector']
+            if result['select']:
+                await self._handle_select(page, dict(shared, type='select', selector=selector, value=fields[selector]), dimensions)
+            else:
+                await self._handle_input(page, dict(shared, type='input', selector=selector, value=fields[selector]), dimensions, domain)
+
+        self._update_status(f"Filled {len(fields)} fields", "input", {"status": "success", "fallbacks": len(retry)})
+        await waits.settled(page, step, 1.0)
+
     async def _handle_click(self, page, step):
         """Handle a click step"""
         selector = step['selector']
@@ -814,7 +1465,7 @@ class PriceCalculator:
         for attempt in range(max_retries):
             try:
                 # Wacht langer op het element
-                element = await page.wait_for_selector(selector, timeout=5000)
+                element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))
                 if not element:
                     raise ValueError(f"Element not found: {selector}")
                 
@@ -823,7 +1474,7 @@ class PriceCalculator:
                 if not is_visible:
                     self._update_status(f"Element {selector} is not visible, trying to scroll into view", "warn")
                     await element.scroll_into_view_if_needed()
-                    await asyncio.sleep(0.5)
+                    await waits.actionable(element, step, 0.5)
                 
                 # Als het een .cart element is of winkelwagen, probeer het op verschillende manieren te klikken
                 if '.cart' in selector.lower() or 'winkelwagen' in selector.lower():
@@ -842,7 +1493,7 @@ class PriceCalculator:
                                 }}, 100);
                             }}
                         """)
-                        await asyncio.sleep(1.0)
+                        await waits.settled(page, step, 1.0, quiet_ms=300)  # The script clicks after 100 ms
                         self._update_status(f"Clicked {selector} using JavaScript", "click", {"status": "success"})
                     except Exception as js_error:
                         self._update_status(f"JavaScript click failed: {str(js_error)}", "warn")
@@ -853,7 +1504,7 @@ class PriceCalculator:
                     await element.click()
                 
                 self._update_status(f"Successfully clicked {selector}", "click", {"status": "success"})
-                await asyncio.sleep(1.0)  # Langere wachttijd na klik
+                await waits.settled(page, step, 1.0)
                 return True
                 
             except Exception as e:
@@ -876,7 +1527,7 @@ class PriceCalculator:
                                 setTimeout(() => cart.click(), 200);
                             }}
                         """)
-                        await asyncio.sleep(1.5)
+                        await waits.settled(page, step, 1.5, quiet_ms=400)  # The script clicks after 200 ms
                         self._update_status(f"Attempted alternative click on {selector}", "click")
                         return True
                     except Exception as final_error:
@@ -886,6 +1537,8 @@ class PriceCalculator:
                     self._update_status(f"Click failed after {max_retries} attempts", "error")
                     raise
                 
+                deadline.check()
+                step_registry.count_retry()
                 await asyncio.sleep(1.0)  # Wacht voordat we het opnieuw proberen
 
     async def _handle_wait(self, step):
@@ -914,7 +1567,19 @@ class PriceCalculator:
         self._update_status("Reading price", "read_price", {"selector": selector})
         
         try:
-            element = await page.wait_for_selector(selector, timeout=5000)  # 5 seconden timeout
+            settle = price_settle.settle_settings(step)
+            if settle:
+                result = await price_settle.wait(page, selector, settle)
+                if result:
+                    if not result['changed']:
+                        message = "Price did not change"
+                    elif result['timed_out']:
+                        message = "Price kept changing, reading it anyway"
+                    else:
+                        message = f"Price settled after {result['settle_ms']} ms"
+                    self._update_status(message, "read_price", result)
+
+            element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000))  # 5 seconden timeout
             if not element:
                 self._update_status("Price element not found, returning 0.00", "read_price", {"price": 0.0})
                 return 0.0
@@ -923,15 +1588,25 @@ class PriceCalculator:
             self._update_status("Found price text", "read_price", {"text": price_text})
             
             # Clean and parse price
-            cleaned_price = re.sub(r'[^\d,.]', '', price_text).replace(',', '.')
-            price = float(cleaned_price)
+            price = self._parse_price_text(price_text)
             
             self._update_status(f"Price found: €{price:.2f}", "read_price", {"price": price})
             return price
+        except deadline.DeadlineExceeded:
+            raise
         except Exception as e:
+            current = deadline.current()
+            if current and current.remaining_ms() <= 0:
+                # The waits were cut to the budget, the step registry reports this as DeadlineExceeded
+                raise
             self._update_status(f"Error reading price, returning 0.00: {str(e)}", "warn")
             return 0.0
 
+    def _parse_price_text(self, price_text: str) -> float:
+        """Parse the text of a price element"""
+        cleaned_price = re.sub(r'[^\d,.]', '', price_text).replace(',', '.')
+        return float(cleaned_price)
+
     def _convert_dimensions(self, dimensions: Dict[str, float], units: Dict[str, str]) -> Dict[str, float]:
         """Convert dimensions to the units required by the domain"""
         converted = {}
@@ -983,7 +1658,7 @@ class PriceCalculator:
                 
                 # Now find the option in the popper container
                 option_selector = f"li[data-value='{value}']"
-                option = await page.wait_for_selector(option_selector, state="visible", timeout=1000)
+                option = await page.wait_for_selector(option_selector, state="visible", timeout=deadline.timeout(1000))
                 if not option:
                     raise ValueError(f"Kon geen optie vinden voor waarde {value}mm")
                 
@@ -1267,11 +1942,9 @@ class PriceCalculator:
     async def analyze_form_fields(self, url: str) -> Dict:
         """Analyseert de form fields op de pagina"""
         try:
-            async with async_playwright() as p:
-                # Launch browser in non-headless mode
-                browser = await p.chromium.launch(headless=False)
+            async with self.browser_pool.context(viewport={'width': 1920, 'height': 1080}) as context:
                 # Create page with full HD viewport
-                page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+                page = await context.new_page()
                 await page.goto(url)
                 
                 dimension_fields = {}
@@ -1308,7 +1981,6 @@ class PriceCalculator:
                             'tag': config['type']
                         }]
                 
-                await browser.close()
                 return dimension_fields
                 
         except Exception as e:
@@ -1393,67 +2065,6 @@ class PriceCalculator:
             self._update_status(f"Modify element failed: {str(e)}", "error")
             raise
 
-    async def _process_step(self, page, step, dimensions):
-        """Process a single step in the configuration"""
-        # Check of dit een geldig stap object is
-        if not isinstance(step, dict):
-            self._update_status(f"Invalid step type: {type(step)}", "error")
-            raise ValueError(f"Step must be a dictionary, got {type(step)}")
-
-        # Valideer dat het stap type bestaat
-        if 'type' not in step:
-            self._update_status("Step missing 'type' field", "error")
-            raise ValueError("Step configuration missing required 'type' field")
-            
-        step_type = step['type']
-        
-        # Voeg extra validatie toe voor specifieke staptypes
-        if step_type == 'select' and 'value' not in step and 'use_index' not in step:
-            # Voor select stappen zonder value of use_index, voeg een lege waarde toe
-            step['value'] = ""
-            self._update_status("Adding empty value for select step", "warn")
-        
-        if step_type == 'input':
-            # Voor input stappen, controleer of we randomiseren
-            if step.get('input_method') == 'randomize':
-                # Als we randomiseren, zorg ervoor dat random_type aanwezig is
-                if 'random_type' not in step:
-                    step['random_type'] = 'Generic Term'
-                    self._update_status("Adding default random_type for input step", "warn")
-            elif 'value' not in step:
-                # Als we niet randomiseren en geen waarde hebben, voeg een lege string toe
-                step['value'] = ""
-                self._update_status("Adding empty value for input step", "warn")
-        
-        try:
-            if step_type == 'select':
-                await self._handle_select(page, step, dimensions)
-            elif step_type == 'input':
-                await self._handle_input(page, step, dimensions)
-            elif step_type == 'click':
-                await self._handle_click(page, step)
-            elif step_type == 'wait':
-                await self._handle_wait(step)
-            elif step_type == 'read_price':
-                return await self._handle_read_price(page, step)
-            elif step_type == 'modify_element':
-                await self._handle_modify(page, step)
-            elif step_type == 'blur':
-                await self._handle_blur(page, step)
-            elif step_type == 'captcha':
-                await self._handle_captcha(page, step)
-            else:
-                self._update_status(f"Unknown step type: {step_type}", "error")
-                raise ValueError(f"Unknown step type: {step_type}")
-                
-        except Exception as e:
-            self._update_status(f"Error processing step: {str(e)}", "error")
-            # Voeg gedetailleerde informatie toe over de stap die mislukte
-            logging.error(f"Failed step details: {json.dumps(step, default=str)}")
-            raise
-        
-        return None 
-
     async def _handle_captcha(self, page, step):
         """Handle different types of captchas including reCAPTCHA and checkbox captchas"""
         captcha_type = step.get('captcha_type', 'checkbox')
@@ -1543,17 +2154,17 @@ class PriceCalculator:
                         
                         # Now find the checkbox within the frame
                         checkbox_selector = selector or 'span[role="checkbox"]'
-                        checkbox = await content_frame.wait_for_selector(checkbox_selector, timeout=5000)
+                        checkbox = await content_frame.wait_for_selector(checkbox_selector, timeout=deadline.timeout(5000))
                         if not checkbox:
                             raise ValueError(f"Captcha checkbox not found in frame with selector: {checkbox_selector}")
                         
                         # Ensure it's visible before clicking
                         await checkbox.scroll_into_view_if_needed()
-                        await asyncio.sleep(0.5)
+                        await waits.actionable(checkbox, step, 0.5)
                         
                         # Click the checkbox
                         await checkbox.click()
-                        await asyncio.sleep(1.0)  # Wait for potential animations
+                        await waits.condition(content_frame, CAPTCHA_CHECKED_SCRIPT, checkbox_selector, step, 1.0)
                         
                         # Check if it was successful
                         is_checked = await content_frame.evaluate(f"""
@@ -1582,11 +2193,11 @@ class PriceCalculator:
                         # Try multiple methods to find and interact with the captcha
                         
                         # Method 1: Direct selector
-                        element = await page.wait_for_selector(selector, timeout=5000, state="visible")
+                        element = await page.wait_for_selector(selector, timeout=deadline.timeout(5000), state="visible")
                         if element:
                             self._update_status("Found captcha checkbox, scrolling to it", "captcha")
                             await element.scroll_into_view_if_needed()
-                            await asyncio.sleep(0.5)
+                            await waits.actionable(element, step, 0.5)
                             
                             # Try to get if it's already checked
                             is_checked = await element.evaluate("""
@@ -1600,7 +2211,7 @@ class PriceCalculator:
                             if not is_checked:
                                 # Click the element
                                 await element.click(force=True)
-                                await asyncio.sleep(1.0)  # Wait for animations
+                                await waits.condition(page, '(el) => el.getAttribute("aria-checked") === "true" || el.checked === true', element, step, 1.0)
                                 
                                 # Check if successful
                                 is_checked = await element.evaluate("""
@@ -1626,10 +2237,10 @@ class PriceCalculator:
                                     content_frame = await frame_elem.content_frame()
                                     if content_frame:
                                         # Look for the checkbox in this frame
-                                        checkbox = await content_frame.wait_for_selector('span[role="checkbox"]', timeout=2000)
+                                        checkbox = await content_frame.wait_for_selector('span[role="checkbox"]', timeout=deadline.timeout(2000))
                                         if checkbox:
                                             await checkbox.click()
-                                            await asyncio.sleep(1.0)
+                                            await waits.condition(content_frame, CAPTCHA_CHECKED_SCRIPT, 'span[role="checkbox"]', step, 1.0)
                                             is_checked = await content_frame.evaluate("""
                                                 () => {
                                                     const el = document.querySelector('span[role="checkbox"]');
@@ -1698,6 +2309,8 @@ class PriceCalculator:
                         self._update_status("Failed to handle captcha after multiple attempts", "error")
                         if skip_on_failure:
                             return
+                    deadline.check()
+                    step_registry.count_retry()
                     await asyncio.sleep(1.0)
         
         elif captcha_type == 'recaptcha_v2':
@@ -1724,7 +2337,7 @@ class PriceCalculator:
                                         await checkbox.click()
                                         self._update_status("Clicked reCAPTCHA checkbox, but cannot solve challenges", "captcha", {"status": "warn"})
                                         # Wait a bit longer to see if it passes without a challenge
-                                        await asyncio.sleep(3.0)
+                                        await waits.condition(frame, CAPTCHA_CHECKED_SCRIPT, 'span[role="checkbox"]', step, 3.0)
                             except Exception:
                                 continue
                 except Exception as e:
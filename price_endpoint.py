@@ -0,0 +1,319 @@
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from urllib.parse import urlsplit, urlunsplit, parse_qsl
+from playwright.async_api import Error as PlaywrightError
+import asyncio
+import copy
+import json
+import logging
+import re
+import time
+from http_client import HttpClient
+
+# Defaults for the `xhr` section of a category config, which is written by learn mode
+DEFAULT_XHR_SETTINGS = {
+    'enabled': True,
+    'fallback_to_browser': True,  # Run the browser steps when the replay fails
+    'includes_vat': False,
+    'max_ratio': 20               # A replayed price more than this factor away from the learned price is rejected
+}
+
+# Requests that can return the price of a form
+RECORDED_RESOURCE_TYPES = ('xhr', 'fetch')
+
+# Request headers that are replayed, cookies and browser specific headers are left out
+REPLAY_HEADERS = ('accept', 'content-type', 'x-requested-with', 'referer')
+
+# Larger responses are pages or assets, not price endpoints
+MAX_BODY_CHARS = 512 * 1024
+
+# Numbers as shops write prices: 1234, 1234.5, 1.234,56 or 1 234,56
+PRICE_NUMBER = re.compile(r'\d{1,3}(?:[.,\s]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d+)?')
+
+
+def xhr_settings(category_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the learned price request of a category, or None if none was learned"""
+    settings = category_config.get('xhr')
+    if not settings:
+        return None
+    merged = dict(DEFAULT_XHR_SETTINGS)
+    merged.update(settings)
+    if not merged['enabled']:
+        return None
+    if not merged.get('url') or 'price_path' not in merged:
+        raise ValueError("The xhr section of a category needs a 'url' and a 'price_path'")
+    return merged
+
+
+def price_numbers(text: str) -> List[float]:
+    """All numbers in a text, with decimal commas and thousands separators resolved"""
+    numbers = []
+    for token in PRICE_NUMBER.findall(text):
+        token = re.sub(r'\s', '', token)
+        last = max(token.rfind(','), token.rfind('.'))
+        # A separator followed by one or two digits is the decimal separator
+        if last != -1 and len(token) - last - 1 in (1, 2):
+            token = re.sub(r'[.,]', '', token[:last]) + '.' + token[last + 1:]
+        else:
+            token = re.sub(r'[.,]', '', token)
+        try:
+            numbers.append(float(token))
+        except ValueError:
+            continue
+    return numbers
+
+
+def _format(value: float) -> Any:
+    return int(value) if float(value).is_integer() else value
+
+
+def _find_price(data: Any, price: float, path: Tuple = ()) -> Optional[Tuple[List[Any], Optional[int]]]:
+    """Path to the value in a JSON document that holds the price, and the number within a text value"""
+    if isinstance(data, bool):
+        return None
+    if isinstance(data, (int, float)):
+        return (list(path), None) if abs(data - price) < 0.005 else None
+    if isinstance(data, str):
+        for match, number in enumerate(price_numbers(data)):
+            if abs(number - price) < 0.005:
+                return list(path), match
+        return None
+    items = data.items() if isinstance(data, dict) else enumerate(data) if isinstance(data, list) else ()
+    for key, value in items:
+        found = _find_price(value, price, path + (key,))
+        if found:
+            return found
+    return None
+
+
+def _follow(data: Any, path: List[Any]) -> Any:
+    for key in path:
+        data = data[key]
+    return data
+
+
+class RecordedExchange:
+    """A request of the page and the text of its response"""
+
+    __slots__ = ('method', 'url', 'headers', 'post_data', 'body')
+
+    def __init__(self, method: str, url: str, headers: Dict[str, str], post_data: Optional[str], body: str):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.post_data = post_data
+        self.body = body
+
+
+class PriceEndpointRecorder:
+    """Records the XHR and fetch requests a page makes while the steps run"""
+
+    def __init__(self, page):
+        self.exchanges: List[RecordedExchange] = []
+        self._reads = []
+        page.on('response', self._response)
+
+    def _response(self, response):
+        if response.request.resource_type in RECORDED_RESOURCE_TYPES:
+            self._reads.append(asyncio.ensure_future(self._read(response)))
+
+    async def _read(self, response):
+        try:
+            body = await response.text()
+            headers = await response.request.all_headers()
+        except PlaywrightError:
+            # The page navigated away before the body could be read
+            return
+        if len(body) > MAX_BODY_CHARS:
+            return
+        request = response.request
+        self.exchanges.append(RecordedExchange(request.method, request.url, headers, request.post_data, body))
+
+    async def finish(self) -> List[RecordedExchange]:
+        """Wait for the responses that are still being read and return all exchanges"""
+        await asyncio.gather(*self._reads, return_exceptions=True)
+        return self.exchanges
+
+
+class _DimensionMatcher:
+    """Recognises the value of a dimension in a request, in mm or cm"""
+
+    def __init__(self, dimensions: Dict[str, float], keys: List[str], convert: Callable[[float, str], float]):
+        self.values: Dict[float, Tuple[str, str]] = {}
+        ambiguous = set()
+        for key in keys:
+            for unit in ('mm', 'cm'):
+                value = float(convert(dimensions[key], unit))
+                if value in self.values and self.values[value][0] != key:
+                    ambiguous.add(value)
+                self.values.setdefault(value, (key, unit))
+        # Two dimensions with the same value cannot be told apart in the request
+        for value in ambiguous:
+            del self.values[value]
+
+    def match(self, value: Any) -> Optional[Tuple[str, str]]:
+        if isinstance(value, bool):
+            return None
+        try:
+            return self.values.get(float(value))
+        except (TypeError, ValueError):
+            return None
+
+
+def _json_fields(data: Any, matcher: _DimensionMatcher, path: Tuple = ()) -> List[Dict[str, Any]]:
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        match = matcher.match(data)
+        if not match:
+            return []
+        return [{"location": "data", "path": list(path), "dimension": match[0], "unit": match[1],
+                 "format": "string" if isinstance(data, str) else "number"}]
+    fields = []
+    for key, value in items:
+        fields += _json_fields(value, matcher, path + (key,))
+    return fields
+
+
+def learn_request(exchanges: List[RecordedExchange], price: float, dimensions: Dict[str, float], keys: List[str],
+                  convert: Callable[[float, str], float]) -> Optional[Dict[str, Any]]:
+    """Find the request that returned the price and describe how to send it for other dimensions.
+
+    The latest JSON response containing the price is used. Its request must contain every
+    dimension in `keys` as a query, form or JSON parameter.
+    """
+    matcher = _DimensionMatcher(dimensions, keys, convert)
+    for exchange in reversed(exchanges):
+        try:
+            response = json.loads(exchange.body)
+        except ValueError:
+            continue
+        found = _find_price(response, price)
+        if not found:
+            continue
+
+        split = urlsplit(exchange.url)
+        params = [list(pair) for pair in parse_qsl(split.query, keep_blank_values=True)]
+        fields = [
+            {"location": "params", "path": [index], "dimension": match[0], "unit": match[1], "format": "string"}
+            for index, (_, value) in enumerate(params) if (match := matcher.match(value))
+        ]
+
+        content_type = exchange.headers.get('content-type', '')
+        body_format = None
+        data = None
+        if exchange.post_data:
+            if 'json' in content_type:
+                body_format = 'json'
+                try:
+                    data = json.loads(exchange.post_data)
+                except ValueError:
+                    continue
+                fields += _json_fields(data, matcher)
+            elif 'x-www-form-urlencoded' in content_type:
+                body_format = 'form'
+                data = [list(pair) for pair in parse_qsl(exchange.post_data, keep_blank_values=True)]
+                fields += [
+                    {"location": "data", "path": [index], "dimension": match[0], "unit": match[1], "format": "string"}
+                    for index, (_, value) in enumerate(data) if (match := matcher.match(value))
+                ]
+            else:
+                continue
+
+        if {field['dimension'] for field in fields} != set(keys):
+            logging.info(f"Response of {exchange.url} contains the price, but not all dimensions are in the request")
+            continue
+
+        return {
+            "method": exchange.method,
+            "url": urlunsplit(split._replace(query='')),
+            "params": params,
+            "body_format": body_format,
+            "data": data,
+            "headers": {name: value for name, value in exchange.headers.items() if name in REPLAY_HEADERS},
+            "fields": fields,
+            "price_path": found[0],
+            "price_match": found[1],
+            "learned_price": price,
+            "learned_dimensions": {key: dimensions[key] for key in keys},
+            "learned_at": time.time()
+        }
+    return None
+
+
+class PriceEndpointReader:
+    """Sends a learned price request for other dimensions and reads the price from the JSON response"""
+
+    def __init__(self, client: HttpClient):
+        self.client = client
+        self._replays = 0
+        self._failures = 0
+        self._learned = 0
+
+    def learned(self):
+        self._learned += 1
+
+    def _render(self, settings: Dict[str, Any], dimensions: Dict[str, float],
+                convert: Callable[[float, str], float]) -> Tuple[List[List[str]], Any]:
+        params = copy.deepcopy(settings['params'])
+        data = copy.deepcopy(settings['data'])
+        for field in settings['fields']:
+            if field['dimension'] not in dimensions:
+                raise ValueError(f"Dimension {field['dimension']} not found in dimensions dict")
+            value = _format(convert(dimensions[field['dimension']], field['unit']))
+            if field['format'] == 'string':
+                value = str(value)
+            if field['location'] == 'params':
+                params[field['path'][0]][1] = value
+            elif settings['body_format'] == 'form':
+                data[field['path'][0]][1] = value
+            else:
+                parent = _follow(data, field['path'][:-1])
+                parent[field['path'][-1]] = value
+        return params, data
+
+    def _check(self, price: float, settings: Dict[str, Any]):
+        """Reject prices that cannot be right, such as a zero from an error response"""
+        if not price > 0:
+            raise ValueError(f"Replayed price request returned an implausible price: {price}")
+        learned = settings.get('learned_price')
+        ratio = float(settings['max_ratio'])
+        if learned and not learned / ratio <= price <= learned * ratio:
+            raise ValueError(f"Replayed price {price} is too far from the learned price {learned}")
+
+    async def fetch_price(self, settings: Dict[str, Any], dimensions: Dict[str, float],
+                          convert: Callable[[float, str], float]) -> float:
+        """Send the learned request for these dimensions and return the price it returns"""
+        params, data = self._render(settings, dimensions, convert)
+        session = await self.client.session()
+        self._replays += 1
+        try:
+            async with session.request(
+                settings['method'].upper(),
+                settings['url'],
+                params=params or None,
+                data=data if settings['body_format'] == 'form' else None,
+                json=data if settings['body_format'] == 'json' else None,
+                headers=settings['headers'] or None
+            ) as response:
+                if response.status >= 400:
+                    raise ValueError(f"Price request to {settings['url']} failed with status {response.status}")
+                body = await response.text()
+
+            value = _follow(json.loads(body), settings['price_path'])
+            if settings.get('price_match') is not None:
+                value = price_numbers(str(value))[settings['price_match']]
+            price = float(value)
+            self._check(price, settings)
+            return price
+        except Exception:
+            self._failures += 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "replays": self._replays,
+            "failures": self._failures,
+            "learned": self._learned
+        }
@@ -0,0 +1,146 @@
+from typing import Dict, Any, Optional, List, Union
+from playwright.async_api import Error as PlaywrightError
+import logging
+import deadline
+
+# Defaults for the `settle` option of a read_price step
+DEFAULT_SETTLE_SETTINGS = {
+    'quiet_ms': 300,    # The price must stay the same this long before it is read
+    'grace_ms': 1000,   # A price that does not change at all is read after quiet_ms plus this
+    'timeout': 10000    # Read the price anyway after this many ms
+}
+
+# Watches the text of the price element from before the action that changes the price.
+# The whole document is observed because shops often replace the price element. For a
+# selector fallback chain the first candidate with an element is read.
+INSTALL_SCRIPT = """
+(selector) => {
+    const selectors = [].concat(selector);
+    const read = () => {
+        for (const candidate of selectors) {
+            let el = null;
+            try {
+                el = document.querySelector(candidate);
+            } catch (e) {
+                continue;
+            }
+            if (el) return el.textContent.trim();
+        }
+        return null;
+    };
+    const previous = window.__priceWatcherSettle;
+    if (previous) {
+        previous.observer.disconnect();
+    }
+    const state = {
+        selector,
+        initial: read(),
+        text: read(),
+        started: performance.now(),
+        lastChange: null,
+        observer: new MutationObserver(() => {
+            const text = read();
+            if (text !== state.text) {
+                state.text = text;
+                state.lastChange = performance.now();
+            }
+        })
+    };
+    state.observer.observe(document.documentElement, { subtree: true, childList: true, characterData: true });
+    window.__priceWatcherSettle = state;
+}
+"""
+
+# Resolves once the price changed and then stayed the same for `quiet` ms. Without an
+# installed watcher it resolves once the price has been stable for `quiet` ms. A price that
+# never changes, such as the same price for the next dimensions of a sweep, is read after
+# `quiet` + `grace` ms. A price that keeps changing is read after `timeout` ms.
+WAIT_SCRIPT = """
+([selector, quiet, grace, timeout]) => new Promise(resolve => {
+    const setTimer = window.__priceWatcherSetTimeout || window.setTimeout;
+    const installed = window.__priceWatcherSettle;
+    // The watcher of a fallback chain covers the candidate the read_price step ended up with
+    const expectChange = !!installed && [].concat(installed.selector).includes(selector);
+    if (!expectChange) {
+        (%s)(selector);
+    }
+    const state = window.__priceWatcherSettle;
+    const begin = performance.now();
+    const check = () => {
+        const now = performance.now();
+        const stableSince = state.lastChange === null ? begin : state.lastChange;
+        const changed = state.text !== state.initial;
+        // A price that changes and returns to its old value has settled as well
+        const settled = (state.lastChange !== null || !expectChange) && now - stableSince >= quiet;
+        const unchanged = state.lastChange === null && now - begin >= quiet + grace;
+        const done = settled || unchanged;
+        if (done || now - begin >= timeout) {
+            state.observer.disconnect();
+            delete window.__priceWatcherSettle;
+            resolve({
+                changed,
+                timed_out: !done,
+                settle_ms: state.lastChange === null ? 0 : Math.round(state.lastChange - state.started),
+                text: state.text
+            });
+        } else {
+            setTimer(check, 25);
+        }
+    };
+    check();
+})
+""" % INSTALL_SCRIPT
+
+
+# Without a watcher the wait only needs the price to be stable for `quiet` ms
+DISCARD_SCRIPT = """
+() => {
+    const installed = window.__priceWatcherSettle;
+    if (installed) {
+        installed.observer.disconnect();
+        delete window.__priceWatcherSettle;
+    }
+}
+"""
+
+
+def settle_settings(step: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the settle settings of a read_price step, or None if the price is read right away"""
+    settings = step.get('settle')
+    if not settings:
+        return None
+    merged = dict(DEFAULT_SETTLE_SETTINGS)
+    if isinstance(settings, dict):
+        merged.update(settings)
+    return merged
+
+
+async def install(page, selector: Union[str, List[str]]):
+    """Start watching the price element, call this before the action that changes the price.
+
+    `selector` may be the candidates of a fallback chain, whichever of them the read_price
+    step picks is then covered by the watcher.
+    """
+    try:
+        await page.evaluate(INSTALL_SCRIPT, selector)
+    except PlaywrightError as e:
+        logging.warning(f"Could not watch price element {selector}: {str(e)}")
+
+
+async def discard(page):
+    """Stop watching the price, call this when the watched action was skipped and cannot change the price"""
+    try:
+        await page.evaluate(DISCARD_SCRIPT)
+    except PlaywrightError as e:
+        logging.warning(f"Could not remove price watcher: {str(e)}")
+
+
+async def wait(page, selector: str, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Wait until the price has settled and return how long that took"""
+    try:
+        return await page.evaluate(WAIT_SCRIPT, [selector, float(settings['quiet_ms']), float(settings['grace_ms']),
+                                                 deadline.timeout(float(settings['timeout']))])
+    except PlaywrightError as e:
+        # A navigation removes the watcher, the price is then read without waiting
+        logging.warning(f"Could not wait for price element {selector} to settle: {str(e)}")
+        return None
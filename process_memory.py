@@ -0,0 +1,70 @@
+from typing import Dict, Optional, List, Tuple
+import os
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _read_processes() -> Dict[int, Tuple[int, int, List[str]]]:
+    """Read (parent pid, resident bytes, command line) of all processes from /proc"""
+    processes = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # The command name can contain spaces, the fields after it cannot
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            with open(f'/proc/{pid}/statm') as f:
+                rss = int(f.read().split()[1]) * PAGE_SIZE
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read().decode(errors='replace').split('\0')
+        except (OSError, ValueError, IndexError):
+            continue
+        processes[pid] = (ppid, rss, cmdline)
+    return processes
+
+
+def _tree_rss(processes: Dict[int, Tuple[int, int, List[str]]], root: int) -> int:
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+
+    total = 0
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        if pid in processes:
+            total += processes[pid][1]
+        pending.extend(children.get(pid, []))
+    return total
+
+
+def is_supported() -> bool:
+    return os.path.isdir('/proc/self')
+
+
+def tree_rss(root: int = None) -> Optional[int]:
+    """Resident memory in bytes of a process and all its descendants"""
+    if not is_supported():
+        return None
+    return _tree_rss(_read_processes(), root or os.getpid())
+
+
+def rss_by_marker(markers: List[str]) -> Dict[str, int]:
+    """Resident memory of the process trees whose command line contains one of the markers.
+
+    Used for browsers launched with a unique marker argument: the marked process is the
+    browser's main process and its descendants are the renderer, GPU and utility processes.
+    """
+    if not is_supported():
+        return {}
+    processes = _read_processes()
+    result = {}
+    for pid, (ppid, _, cmdline) in processes.items():
+        parent_cmdline = processes.get(ppid, (0, 0, []))[2]
+        for marker in markers:
+            # Skip child processes in case the marker is passed on to them
+            if marker in cmdline and marker not in parent_cmdline:
+                result[marker] = _tree_rss(processes, pid)
+    return result
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from price_calculator import PriceCalculator
+
+
+async def record(url, category, dimensions, country):
+    calculator = PriceCalculator()
+    await calculator.browser_pool.start()
+    try:
+        run = await calculator.record_har(url, dimensions, country=country, category=category)
+    finally:
+        await calculator.stop()
+    print(f"Recorded {calculator._normalize_domain(url)}/{category}: {run['price_excl_vat']:.2f} excl. VAT")
+
+
+async def replay(url, category, runs, tolerance=0.01):
+    """Replay the recorded run of a domain offline.
+
+    Returns True if every replay returned the recorded price.
+    """
+    calculator = PriceCalculator()
+    domain = calculator._normalize_domain(url)
+    expected = calculator.har_archive.load_run(domain, category)['price_excl_vat']
+
+    await calculator.browser_pool.start()
+    durations = []
+    correct = True
+    try:
+        for number in range(1, runs + 1):
+            start = time.perf_counter()
+            try:
+                price_excl, _ = await calculator.replay_har(url, category=category)
+            except Exception as e:
+                print(f"  run {number}: failed: {e}")
+                correct = False
+                continue
+            durations.append(time.perf_counter() - start)
+            status = "ok" if abs(price_excl - expected) <= tolerance else f"expected {expected:.2f}"
+            correct = correct and status == "ok"
+            print(f"  run {number}: {durations[-1]:.2f}s  {price_excl:.2f}  {status}")
+    finally:
+        await calculator.stop()
+
+    if durations:
+        print(f"Median {statistics.median(durations):.2f}s over {len(durations)} runs")
+    return correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record the network traffic of a run or replay it offline')
+    parser.add_argument('mode', choices=['record', 'replay'], help='Record a HAR archive or replay the recorded run')
+    parser.add_argument('url', help='Product URL of the domain')
+    parser.add_argument('--category', default='square_meter_price', help='Category whose steps are run')
+    parser.add_argument('--country', default='nl', help='Country for the VAT rate when recording')
+    parser.add_argument('--thickness', type=float, default=3, help='Thickness in mm when recording')
+    parser.add_argument('--length', type=float, default=1000, help='Length in mm when recording')
+    parser.add_argument('--width', type=float, default=500, help='Width in mm when recording')
+    parser.add_argument('--runs', type=int, default=1, help='Number of replays')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Allowed difference from the recorded price')
+
+    args = parser.parse_args()
+
+    if args.mode == 'record':
+        dimensions = {'thickness': args.thickness, 'length': args.length, 'width': args.width}
+        asyncio.run(record(args.url, args.category, dimensions, args.country))
+        return
+
+    if not asyncio.run(replay(args.url, args.category, max(1, args.runs), tolerance=args.tolerance)):
+        print("Replay did not return the recorded price")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
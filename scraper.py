@@ -1,14 +1,14 @@
-from playwright.async_api import async_playwright
 from typing import Dict, Any, Optional
 from urllib.parse import urlparse
 import logging
 from database import SessionLocal
 import crud
-from config import HEADLESS
+from browser_pool import BrowserPool, browser_pool as shared_browser_pool
 
 class MaterialScraper:
-    def __init__(self):
+    def __init__(self, browser_pool: BrowserPool = None):
         self.db = SessionLocal()
+        self.browser_pool = browser_pool or shared_browser_pool
         
     def __del__(self):
         if hasattr(self, 'db'):
@@ -20,9 +20,8 @@ class MaterialScraper:
         
     async def analyze_form_fields(self, url: str) -> Dict[str, Any]:
         """Analyze form fields on the page using domain configuration from database"""
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=HEADLESS)
-            page = await browser.new_page()
+        async with self.browser_pool.context() as context:
+            page = await context.new_page()
             await page.goto(url)
             
             domain = self._normalize_domain(url)
@@ -65,7 +64,6 @@ class MaterialScraper:
                 except Exception as e:
                     logging.error(f"Error analyzing {field_type} field: {str(e)}")
             
-            await browser.close()
             return dimension_fields
             
     async def _get_select_options(self, element) -> list:
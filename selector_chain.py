@@ -0,0 +1,170 @@
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+from config import DATA_DIR
+import deadline
+
+SELECTOR_STATS_FILE = os.path.join(DATA_DIR, 'selector_stats.json')
+
+# How long the candidates of a step are raced before the step fails
+CANDIDATE_TIMEOUT_MS = 5000
+
+# A candidate that missed this many runs in a row is tried after all others
+DEMOTE_AFTER = 5
+
+# Indexes of the candidates that are in the page and visible right now
+VISIBLE_CANDIDATES_SCRIPT = """(selectors) => selectors.map((selector, index) => {
+    let el;
+    try {
+        el = document.querySelector(selector);
+    } catch (e) {
+        return -1;
+    }
+    if (!el) return -1;
+    const style = window.getComputedStyle(el);
+    const rect = el.getBoundingClientRect();
+    const visible = style.visibility !== 'hidden' && style.display !== 'none' && rect.width > 0 && rect.height > 0;
+    return visible ? index : -1;
+}).filter(index => index >= 0)"""
+
+
+def candidates(step: Dict[str, Any]) -> Optional[List[str]]:
+    """The candidate selectors of a step, None for a step with a single selector"""
+    return step.get('selector_candidates')
+
+
+def chain_key(selectors: List[str]) -> str:
+    return ' || '.join(selectors)
+
+
+async def race(page, selectors: List[str], timeout_ms: float = CANDIDATE_TIMEOUT_MS) -> str:
+    """Return the first of the selectors that matches a visible element.
+
+    Candidates that are visible right away are chosen in the given order, otherwise all
+    candidates are waited for at once and the first one to appear wins.
+    """
+    visible = await page.evaluate(VISIBLE_CANDIDATES_SCRIPT, selectors)
+    if visible:
+        return selectors[visible[0]]
+
+    timeout = deadline.timeout(timeout_ms)
+    waiters = {asyncio.ensure_future(page.wait_for_selector(selector, timeout=timeout)): selector for selector in selectors}
+    pending = set(waiters)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Of candidates that appear together the one ranked first wins
+            for waiter in sorted(done, key=lambda waiter: selectors.index(waiters[waiter])):
+                if waiter.exception() is None and waiter.result() is not None:
+                    return waiters[waiter]
+    finally:
+        for waiter in pending:
+            waiter.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    raise ValueError(f"None of the selectors matched within {timeout:.0f} ms: {', '.join(selectors)}")
+
+
+class SelectorStatsStore:
+    """Hits and misses of candidate selectors per domain, kept across restarts.
+
+    The candidates of a step are tried in the order of their hit rate, so a selector
+    that stopped working after a markup change is no longer tried first. Candidates that
+    missed `DEMOTE_AFTER` runs in a row go to the end of the list.
+    """
+
+    def __init__(self, path: str = SELECTOR_STATS_FILE):
+        self.path = path
+        self._stats: Optional[Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]] = None
+        self._updates = 0
+        self._fallbacks = 0
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]:
+        if self._stats is None:
+            try:
+                with open(self.path) as f:
+                    self._stats = json.load(f)
+            except (OSError, ValueError):
+                self._stats = {}
+        return self._stats
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self._stats, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            logging.warning(f"Could not save selector statistics: {str(e)}")
+
+    @staticmethod
+    def _score(entry: Optional[Dict[str, Any]]) -> Tuple[bool, float]:
+        if not entry:
+            return False, 0.5
+        demoted = entry['streak'] >= DEMOTE_AFTER
+        # Smoothed, so one early hit does not outrank a long record
+        return demoted, (entry['hits'] + 1) / (entry['hits'] + entry['misses'] + 2)
+
+    def order(self, domain: Optional[str], selectors: List[str]) -> List[str]:
+        """The candidates in the order they should be tried, the configured order breaks ties"""
+        if not domain:
+            return list(selectors)
+        chain = self._load().get(domain, {}).get(chain_key(selectors), {})
+
+        def rank(item: Tuple[int, str]) -> Tuple[bool, float, int]:
+            demoted, hit_rate = self._score(chain.get(item[1]))
+            return demoted, -hit_rate, item[0]
+
+        return [selector for _, selector in sorted(enumerate(selectors), key=rank)]
+
+    def record(self, domain: Optional[str], selectors: List[str], tried: List[str], winner: Optional[str]):
+        """Count a hit for the winner and a miss for the candidates that were ranked before it"""
+        if not domain:
+            return
+        chain = self._load().setdefault(domain, {}).setdefault(chain_key(selectors), {})
+        missed = tried if winner is None else tried[:tried.index(winner)]
+        if missed:
+            self._fallbacks += 1
+        now = time.time()
+        reordered = False
+        for selector in missed:
+            entry = chain.setdefault(selector, {"hits": 0, "misses": 0, "streak": 0, "last_hit": None})
+            entry['misses'] += 1
+            entry['streak'] += 1
+            if entry['streak'] == DEMOTE_AFTER:
+                logging.info(f"Demoting selector {selector} of {domain}, it missed {DEMOTE_AFTER} runs in a row")
+                reordered = True
+        if winner is not None:
+            entry = chain.setdefault(winner, {"hits": 0, "misses": 0, "streak": 0, "last_hit": None})
+            entry['hits'] += 1
+            entry['streak'] = 0
+            entry['last_hit'] = now
+            reordered = reordered or tried[0] != winner
+        self._updates += 1
+        # Only changes of the order are written right away
+        if reordered or self._updates % 20 == 0:
+            self._save()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._load()
+        domains = {}
+        dead = 0
+        for domain, chains in stats.items():
+            domains[domain] = {}
+            for key, chain in chains.items():
+                entries = {}
+                for selector, entry in chain.items():
+                    demoted, hit_rate = self._score(entry)
+                    # Never matched and demoted, a candidate the config can do without
+                    unused = demoted and entry['hits'] == 0
+                    dead += unused
+                    entries[selector] = dict(entry, hit_rate=round(hit_rate, 3), demoted=demoted, dead=unused)
+                domains[domain][key] = entries
+        return {
+            "domains": domains,
+            "chains": sum(len(chains) for chains in stats.values()),
+            "dead_selectors": dead,
+            "fallbacks": self._fallbacks
+        }
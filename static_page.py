@@ -0,0 +1,68 @@
+from typing import Dict, Any, Optional, Callable
+from bs4 import BeautifulSoup
+import logging
+from http_client import HttpClient
+
+# Defaults for the `http` section of a category config
+DEFAULT_HTTP_SETTINGS = {
+    'enabled': True,
+    'method': 'GET',
+    'params': {},               # Query parameters
+    'data': {},                 # Form parameters, sent as the request body
+    'headers': {},
+    'unit': 'mm',
+    'includes_vat': False,
+    'fallback_to_browser': True  # Run the browser steps when the request fails
+}
+
+
+def http_settings(category_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the request template of a category, or None if the category needs a browser"""
+    settings = category_config.get('http')
+    if not settings:
+        return None
+    merged = dict(DEFAULT_HTTP_SETTINGS)
+    merged.update(settings)
+    if not merged['enabled']:
+        return None
+    if not merged.get('url') or not merged.get('price_selector'):
+        raise ValueError("The http section of a category needs a 'url' and a 'price_selector'")
+    return merged
+
+
+class StaticPriceReader:
+    """Reads prices from server-rendered HTML without starting a browser.
+
+    The request is described by a template whose URL, query and form parameters may
+    contain {thickness}, {length} and {width}. `render` fills in these placeholders.
+    """
+
+    def __init__(self, client: HttpClient):
+        self.client = client
+
+    async def fetch(self, settings: Dict[str, Any], render: Callable[[str], str]) -> str:
+        """Send the request of a template and return the response body"""
+        url = render(settings['url'])
+        params = {name: render(str(value)) for name, value in settings['params'].items()}
+        data = {name: render(str(value)) for name, value in settings['data'].items()}
+
+        session = await self.client.session()
+        async with session.request(
+            settings['method'].upper(),
+            url,
+            params=params or None,
+            data=data or None,
+            headers=settings['headers'] or None
+        ) as response:
+            if response.status >= 400:
+                raise ValueError(f"Price request to {url} failed with status {response.status}")
+            return await response.text()
+
+    def read_price_text(self, html: str, selector: str) -> str:
+        """Read the text of the price element matching a CSS selector"""
+        element = BeautifulSoup(html, 'html.parser').select_one(selector)
+        if element is None:
+            raise ValueError(f"Price element {selector} not found in HTML")
+        price_text = element.get_text(strip=True)
+        logging.info(f"Found static price text: {price_text}")
+        return price_text
@@ -0,0 +1,258 @@
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from collections import OrderedDict
+from types import MappingProxyType
+import copy
+import hashlib
+import json
+import logging
+import re
+import input_strategy
+
+# Placeholders that are replaced with the requested dimensions
+DIMENSION_KEYS = ('thickness', 'width', 'length', 'quantity')
+PLACEHOLDER = re.compile(r'\{(' + '|'.join(DIMENSION_KEYS) + r')\}')
+
+STEP_TYPES = ('select', 'input', 'fill_form', 'click', 'wait', 'read_price', 'modify_element', 'blur', 'captcha')
+
+# Step types that cannot run without a selector
+SELECTOR_REQUIRED = ('input', 'click', 'read_price', 'modify_element')
+
+
+class Template:
+    """A step value with {thickness}, {width}, {length} and {quantity} placeholders, parsed once"""
+
+    __slots__ = ('raw', 'parts')
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        # Splitting on a pattern with one group gives literal text at even positions and
+        # dimension names at odd positions
+        self.parts = tuple(PLACEHOLDER.split(raw))
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        return self.parts[1::2]
+
+    def render(self, dimensions: Dict[str, float], unit: str, convert: Callable[[float, str], float]) -> Tuple[str, List[Tuple[str, Any]]]:
+        """Return the text with the dimensions filled in and the substituted values"""
+        text = []
+        substitutions = []
+        for position, part in enumerate(self.parts):
+            if position % 2 == 0:
+                text.append(part)
+                continue
+            if part not in dimensions:
+                raise ValueError(f"Dimension {part} not found in dimensions dict")
+            value = convert(dimensions[part], unit)
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            text.append(str(value))
+            substitutions.append((part, value))
+        return ''.join(text), substitutions
+
+
+class PlanStep:
+    """A validated step with resolved defaults. The options must not be changed."""
+
+    __slots__ = ('index', 'type', 'selector', 'options', 'template', 'field_templates')
+
+    def __init__(self, index: int, options: Dict[str, Any]):
+        self.index = index
+        self.type = options['type']
+        self.selector = options.get('selector')
+        self.options = MappingProxyType(options)
+        value = options.get('value')
+        self.template = Template(value) if isinstance(value, str) and PLACEHOLDER.search(value) else None
+        # The values of a fill_form step, by selector
+        self.field_templates = {
+            selector: Template(value) for selector, value in options.get('fields', {}).items() if PLACEHOLDER.search(value)
+        } if self.type == 'fill_form' else {}
+
+    @property
+    def templated(self) -> bool:
+        return bool(self.template or self.field_templates)
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        """The dimensions the step fills in"""
+        templates = ([self.template] if self.template else []) + list(self.field_templates.values())
+        return tuple(key for template in templates for key in template.keys)
+
+    def render(self, dimensions: Dict[str, float], convert: Callable[[float, str], float]) -> Tuple[Dict[str, Any], List[Tuple[str, Any]]]:
+        """Return a step dict for one run, which the handlers may change freely"""
+        step = copy.deepcopy(dict(self.options))
+        substitutions = []
+        if self.template:
+            step['value'], substitutions = self.template.render(dimensions, step.get('unit', 'mm'), convert)
+        for selector, template in self.field_templates.items():
+            step['fields'][selector], field_substitutions = template.render(dimensions, step.get('unit', 'mm'), convert)
+            substitutions += field_substitutions
+        return step, substitutions
+
+
+def _resolve(index: int, step: Dict[str, Any], step_types: Tuple[str, ...] = STEP_TYPES) -> Dict[str, Any]:
+    """Validate a step and fill in the defaults the handlers used to add at run time"""
+    if not isinstance(step, dict):
+        raise ValueError(f"Step {index + 1} must be a dictionary, got {type(step).__name__}")
+    if 'type' not in step:
+        raise ValueError(f"Step {index + 1} is missing the required 'type' field")
+
+    options = copy.deepcopy(step)
+    step_type = options['type']
+
+    if step_type == 'select':
+        if 'selector' not in options and 'select_element' in options:
+            options['selector'] = options['select_element']
+        if 'value' not in options:
+            if options.get('use_index') and 'option_index' in options:
+                options['value'] = f"index:{options['option_index']}"
+            elif 'selector' in options:
+                logging.warning(f"No value specified for select step {index + 1}, using empty value")
+                options['value'] = ""
+            else:
+                raise ValueError(f"Select step {index + 1} needs 'value' or 'use_index' + 'option_index'")
+        if 'selector' not in options:
+            raise ValueError(f"Missing required field 'selector' in select step {index + 1}")
+        options['value'] = str(options['value'])
+    elif step_type == 'input':
+        randomize = options.get('randomize') or options.get('input_method') == 'randomize'
+        if randomize:
+            options.setdefault('random_type', 'Generic Term')
+        elif 'value' not in options:
+            options['value'] = ""
+        if 'value' in options:
+            options['value'] = str(options['value'])
+        try:
+            input_strategy.step_strategy(options)
+        except ValueError as e:
+            raise ValueError(f"Step {index + 1}: {str(e)}")
+    elif step_type == 'fill_form':
+        fields = options.get('fields')
+        if not isinstance(fields, dict) or not fields:
+            raise ValueError(f"Fill_form step {index + 1} needs 'fields', a map of selector to value")
+        for selector in fields:
+            if not selector.strip():
+                raise ValueError(f"Fill_form step {index + 1} has an empty selector in 'fields'")
+        options['fields'] = {selector: str(value) for selector, value in fields.items()}
+        try:
+            input_strategy.step_strategy(options)
+        except ValueError as e:
+            raise ValueError(f"Step {index + 1}: {str(e)}")
+    elif step_type not in step_types:
+        logging.warning(f"Unknown step type '{step_type}' in step {index + 1} is skipped")
+
+    # A list of selectors is a fallback chain, the first one that matches is used
+    selector = options.get('selector')
+    if isinstance(selector, list):
+        if not selector or not all(isinstance(candidate, str) and candidate.strip() for candidate in selector):
+            raise ValueError(f"Step {index + 1} ({step_type}) needs a list of non-empty selectors")
+        options['selector_candidates'] = selector
+        options['selector'] = selector[0]
+
+    if step_type in SELECTOR_REQUIRED or step_type == 'select':
+        selector = options.get('selector')
+        if not isinstance(selector, str) or not selector.strip():
+            raise ValueError(f"Step {index + 1} ({step_type}) needs a non-empty 'selector'")
+    return options
+
+
+class StepPlan:
+    """The steps of one category, compiled once per config version and shared by all runs"""
+
+    __slots__ = ('domain', 'category', 'version', 'steps')
+
+    def __init__(self, domain: str, category: str, version: str, steps: Tuple[PlanStep, ...]):
+        self.domain = domain
+        self.category = category
+        self.version = version
+        self.steps = steps
+
+    @classmethod
+    def compile(cls, domain: str, category: str, raw_steps: List[Dict[str, Any]], version: str,
+                step_types: Tuple[str, ...] = STEP_TYPES) -> 'StepPlan':
+        steps = tuple(PlanStep(index, _resolve(index, step, step_types)) for index, step in enumerate(raw_steps))
+        return cls(domain, category, version, steps)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def dimension_keys(self) -> List[str]:
+        """The dimensions the steps fill in"""
+        keys = {key for plan_step in self.steps for key in plan_step.keys}
+        return [key for key in DIMENSION_KEYS if key in keys]
+
+    def prefix_length(self) -> int:
+        """Number of leading steps that are the same for all dimensions"""
+        for plan_step in self.steps:
+            if plan_step.templated or plan_step.type == 'read_price':
+                return plan_step.index
+        return len(self.steps)
+
+
+class ExecutionContext:
+    """State of a single run through a plan: the dimensions and the rendered steps"""
+
+    __slots__ = ('plan', 'dimensions', 'convert', '_rendered')
+
+    def __init__(self, plan: StepPlan, dimensions: Dict[str, float], convert: Callable[[float, str], float]):
+        self.plan = plan
+        self.dimensions = dimensions
+        self.convert = convert
+        self._rendered: Dict[int, Tuple[Dict[str, Any], List[Tuple[str, Any]]]] = {}
+
+    def step(self, index: int) -> Tuple[Dict[str, Any], List[Tuple[str, Any]]]:
+        """The step dict for this run and the dimensions that were filled in"""
+        if index not in self._rendered:
+            self._rendered[index] = self.plan.steps[index].render(self.dimensions, self.convert)
+        return self._rendered[index]
+
+    def changed_steps(self, previous: 'ExecutionContext') -> List[int]:
+        """Indexes of the templated steps whose value differs from a previous run of the plan"""
+        changed = []
+        for plan_step in self.plan.steps:
+            if not plan_step.templated:
+                continue
+            step, previous_step = self.step(plan_step.index)[0], previous.step(plan_step.index)[0]
+            if step.get('value') != previous_step.get('value') or step.get('fields') != previous_step.get('fields'):
+                changed.append(plan_step.index)
+        return changed
+
+
+def config_version(raw_steps: List[Dict[str, Any]]) -> str:
+    """Hash of the steps, changes whenever the configuration is edited"""
+    return hashlib.sha256(json.dumps(raw_steps, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class PlanCache:
+    """Compiled plans by domain, category and config version, least recently used removed first"""
+
+    def __init__(self, max_plans: int = 256, step_types: Callable[[], Tuple[str, ...]] = None):
+        self.max_plans = max_plans
+        # Step types with a handler, custom types can be registered after the cache is created
+        self.step_types = step_types or (lambda: STEP_TYPES)
+        self._plans: OrderedDict = OrderedDict()
+        self._compiles = 0
+        self._hits = 0
+
+    def get(self, domain: str, category: str, raw_steps: List[Dict[str, Any]], version: Optional[str] = None) -> StepPlan:
+        """The plan of the steps, `version` names the stored config they come from, otherwise they are hashed"""
+        key = (domain, category, version or config_version(raw_steps))
+        plan = self._plans.get(key)
+        if plan is not None:
+            self._plans.move_to_end(key)
+            self._hits += 1
+            return plan
+
+        plan = StepPlan.compile(domain, category, raw_steps, key[2], self.step_types())
+        self._compiles += 1
+        self._plans[key] = plan
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+        return plan
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "plans": len(self._plans),
+            "compiles": self._compiles,
+            "hits": self._hits
+        }
@@ -0,0 +1,208 @@
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+from contextvars import ContextVar
+import logging
+import time
+import deadline
+
+# Timings of the run executing in the current task, and of the step it is executing
+_timings: ContextVar[Optional['RunTimings']] = ContextVar('run_timings', default=None)
+_current_step: ContextVar[Optional['StepTiming']] = ContextVar('step_timing', default=None)
+
+
+class StepCall:
+    """What a step handler gets: the page, the step dict of this run and where it runs"""
+
+    __slots__ = ('page', 'step', 'index', 'dimensions', 'domain')
+
+    def __init__(self, page, step: Dict[str, Any], index: int, dimensions: Dict[str, float], domain: str):
+        self.page = page
+        self.step = step
+        self.index = index
+        self.dimensions = dimensions
+        self.domain = domain
+
+
+class StepTiming:
+    """Wall time, retries and Playwright round trips of one executed step"""
+
+    __slots__ = ('index', 'type', 'selector', 'wall_ms', 'retries', 'round_trips', 'outcome')
+
+    def __init__(self, index: int, step_type: str, selector: Optional[str], count_round_trips: bool):
+        self.index = index
+        self.type = step_type
+        self.selector = selector
+        self.wall_ms = 0.0
+        self.retries = 0
+        self.round_trips = 0 if count_round_trips else None
+        self.outcome = 'running'
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "type": self.type,
+            "selector": self.selector,
+            "wall_ms": round(self.wall_ms, 1),
+            "retries": self.retries,
+            "round_trips": self.round_trips,
+            "outcome": self.outcome
+        }
+
+
+class RunTimings:
+    """The step timings of one calculation"""
+
+    def __init__(self):
+        self.steps: List[StepTiming] = []
+        self._started = time.perf_counter()
+
+    def add(self, timing: StepTiming):
+        self.steps.append(timing)
+
+    def as_dict(self) -> Dict[str, Any]:
+        by_type: Dict[str, float] = {}
+        for timing in self.steps:
+            by_type[timing.type] = round(by_type.get(timing.type, 0.0) + timing.wall_ms, 1)
+        return {
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "steps_ms": round(sum(timing.wall_ms for timing in self.steps), 1),
+            "skipped": sum(timing.outcome == 'skipped' for timing in self.steps),
+            "by_type": by_type,
+            "steps": [timing.as_dict() for timing in self.steps]
+        }
+
+
+def set_timings(timings: RunTimings):
+    """Collect the step timings of the current run, returns a token for `reset_timings`"""
+    return _timings.set(timings)
+
+
+def reset_timings(token):
+    _timings.reset(token)
+
+
+def current_timings() -> Optional[RunTimings]:
+    return _timings.get()
+
+
+def count_retry():
+    """Count a retry of the running step, handlers call this before they try again"""
+    timing = _current_step.get()
+    if timing:
+        timing.retries += 1
+
+
+def mark_skipped():
+    """Report the running step as skipped, handlers call this when the page is already in the target state"""
+    timing = _current_step.get()
+    if timing:
+        timing.outcome = 'skipped'
+
+
+def _install_round_trip_counter() -> bool:
+    """Count the messages Playwright sends to the browser for the running step.
+
+    Playwright has no public hook for this, so the method of its connection that sends a
+    message is wrapped. Returns False when the method is not found in this version, the
+    round trips are then reported as None.
+    """
+    try:
+        from playwright._impl._connection import Connection
+    except ImportError:
+        return False
+    for name in ('_send_message_to_server', 'send_message_to_server'):
+        send = getattr(Connection, name, None)
+        if send is None:
+            continue
+        if getattr(send, 'counts_round_trips', False):
+            return True
+
+        def counted(self, *args, _send=send, **kwargs):
+            timing = _current_step.get()
+            if timing and timing.round_trips is not None:
+                timing.round_trips += 1
+            return _send(self, *args, **kwargs)
+
+        counted.counts_round_trips = True
+        setattr(Connection, name, counted)
+        return True
+    return False
+
+
+StepHandler = Callable[[StepCall], Awaitable[Optional[float]]]
+StepHook = Callable[[StepCall, StepTiming], Any]
+StepPreparer = Callable[[StepCall], Awaitable[None]]
+
+
+class StepRegistry:
+    """Maps step types to their handlers and runs every step with the same instrumentation.
+
+    A handler is a coroutine function that takes a `StepCall` and returns the price for
+    steps that read one, otherwise None. Hooks registered with `before_step` and
+    `after_step` are called with the call and its `StepTiming` around every step.
+    Coroutines registered with `prepare_step` run before the handler and may change the
+    step dict, their time counts towards the step.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, StepHandler] = {}
+        self._before: List[StepHook] = []
+        self._after: List[StepHook] = []
+        self._prepare: List[StepPreparer] = []
+        self.counts_round_trips = _install_round_trip_counter()
+
+    def register(self, step_type: str, handler: StepHandler):
+        if step_type in self._handlers:
+            logging.info(f"Replacing the handler of step type '{step_type}'")
+        self._handlers[step_type] = handler
+
+    def types(self) -> Tuple[str, ...]:
+        return tuple(self._handlers)
+
+    def before_step(self, hook: StepHook):
+        self._before.append(hook)
+
+    def after_step(self, hook: StepHook):
+        self._after.append(hook)
+
+    def prepare_step(self, preparer: StepPreparer):
+        self._prepare.append(preparer)
+
+    async def execute(self, call: StepCall) -> Optional[float]:
+        step_type = call.step['type']
+        handler = self._handlers.get(step_type)
+        if handler is None:
+            logging.warning(f"No handler for step type '{step_type}', step {call.index + 1} is skipped")
+            return None
+
+        selector = call.step.get('selector')
+        deadline.set_activity(f"step {call.index + 1} ({step_type}{' ' + selector if selector else ''})")
+        deadline.check()
+
+        timing = StepTiming(call.index, step_type, selector, self.counts_round_trips)
+        token = _current_step.set(timing)
+        for hook in self._before:
+            hook(call, timing)
+        start = time.perf_counter()
+        try:
+            for preparer in self._prepare:
+                await preparer(call)
+            timing.selector = call.step.get('selector')
+            result = await handler(call)
+            if timing.outcome == 'running':
+                timing.outcome = 'ok'
+            return result
+        except Exception as e:
+            timing.outcome = 'error'
+            current = deadline.current()
+            if current and current.remaining_ms() <= 0 and not isinstance(e, deadline.DeadlineExceeded):
+                # The step failed because its timeouts were cut to the remaining budget
+                raise current.exceeded() from e
+            raise
+        finally:
+            timing.wall_ms = (time.perf_counter() - start) * 1000
+            _current_step.reset(token)
+            run = _timings.get()
+            if run is not None:
+                run.add(timing)
+            for hook in self._after:
+                hook(call, timing)
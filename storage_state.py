@@ -0,0 +1,96 @@
+from typing import Dict, Any, Optional, List
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from config import DATA_DIR
+
+STORAGE_STATE_DIR = os.path.join(DATA_DIR, 'storage_state')
+
+# Defaults for the `storage_state` section of a category config
+DEFAULT_STORAGE_STATE_SETTINGS = {
+    'enabled': True,
+    'setup_steps': 0,  # Number of leading steps whose effect is captured in the snapshot
+    'ttl': 3600        # Seconds before a snapshot is captured again
+}
+
+
+def storage_state_settings(category_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the snapshot settings of a category, or None if snapshots are not used"""
+    settings = category_config.get('storage_state')
+    if not settings:
+        return None
+    merged = dict(DEFAULT_STORAGE_STATE_SETTINGS)
+    merged.update(settings)
+    if not merged['enabled'] or int(merged['setup_steps']) <= 0:
+        return None
+    return merged
+
+
+class StorageStateStore:
+    """Snapshots of cookies and localStorage taken after the setup steps of a category.
+
+    A snapshot belongs to one domain and category and is only valid for the setup steps
+    it was captured with: changing those steps or exceeding the TTL invalidates it.
+    """
+
+    def __init__(self, directory: str = STORAGE_STATE_DIR):
+        self.directory = directory
+        self._captures = 0
+        self._reuses = 0
+        self._invalidations = 0
+
+    def _path(self, domain: str, category: str) -> str:
+        name = re.sub(r'[^a-zA-Z0-9_.-]', '_', f"{domain}__{category}")
+        return os.path.join(self.directory, f"{name}.json")
+
+    @staticmethod
+    def fingerprint(steps: List[Dict[str, Any]]) -> str:
+        """Hash of the setup steps, so edited steps never reuse an old snapshot"""
+        return hashlib.sha256(json.dumps(steps, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load(self, domain: str, category: str, fingerprint: str, ttl: float) -> Optional[Dict[str, Any]]:
+        """Return the storage state if a fresh snapshot for these setup steps exists"""
+        try:
+            with open(self._path(domain, category)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if snapshot.get('fingerprint') != fingerprint:
+            return None
+        if time.time() - snapshot.get('captured_at', 0) > ttl:
+            logging.info(f"Storage state snapshot for {domain}/{category} expired")
+            return None
+        self._reuses += 1
+        return snapshot['storage_state']
+
+    def save(self, domain: str, category: str, fingerprint: str, storage_state: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(domain, category)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({
+                "fingerprint": fingerprint,
+                "captured_at": time.time(),
+                "storage_state": storage_state
+            }, f)
+        os.replace(path + '.tmp', path)
+        self._captures += 1
+        logging.info(f"Captured storage state snapshot for {domain}/{category}")
+
+    def invalidate(self, domain: str, category: str):
+        try:
+            os.remove(self._path(domain, category))
+            self._invalidations += 1
+            logging.info(f"Invalidated storage state snapshot for {domain}/{category}")
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "captures": self._captures,
+            "reuses": self._reuses,
+            "invalidations": self._invalidations
+        }
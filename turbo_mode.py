@@ -0,0 +1,125 @@
+from typing import Dict, Any, Optional
+from contextvars import ContextVar
+import asyncio
+import json
+
+# Defaults for the `turbo` section of a domain config
+DEFAULT_TURBO_SETTINGS = {
+    'enabled': True,
+    'delay_factor': 0.25,  # Multiplier for the fixed delays after actions in the step handlers
+    'timer_factor': 0.5,   # Multiplier for short setTimeout delays on the page
+    'timer_max_ms': 500    # Only timers up to this delay are shortened, longer ones are left alone
+}
+
+# Delay multiplier of the run executing in the current task
+_delay_factor: ContextVar[float] = ContextVar('turbo_delay_factor', default=1.0)
+
+# Runs before any script of the page. Animations and transitions are switched off with a
+# stylesheet, smooth scrolling is turned into instant scrolling and short timers, which
+# sites use to debounce UI updates, are shortened. Timers longer than the limit are not
+# touched, so polling and session logic keep their timing.
+TURBO_INIT_SCRIPT = """
+(settings) => {
+    const css = `*, *::before, *::after {
+        transition: none !important;
+        transition-duration: 0s !important;
+        transition-delay: 0s !important;
+        animation: none !important;
+        animation-duration: 0s !important;
+        animation-delay: 0s !important;
+        scroll-behavior: auto !important;
+    }`;
+    const addStyle = () => {
+        const style = document.createElement('style');
+        style.setAttribute('data-price-watcher', 'turbo');
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    };
+    if (document.documentElement) {
+        addStyle();
+    } else {
+        document.addEventListener('DOMContentLoaded', addStyle, { once: true });
+    }
+
+    const instant = (options) => {
+        if (options && typeof options === 'object') {
+            return Object.assign({}, options, { behavior: 'auto' });
+        }
+        return options;
+    };
+    const scrollIntoView = Element.prototype.scrollIntoView;
+    Element.prototype.scrollIntoView = function (options) {
+        return scrollIntoView.call(this, instant(options));
+    };
+    for (const name of ['scroll', 'scrollTo', 'scrollBy']) {
+        const windowScroll = window[name];
+        window[name] = function (options, ...rest) {
+            return windowScroll.call(this, instant(options), ...rest);
+        };
+        const elementScroll = Element.prototype[name];
+        if (elementScroll) {
+            Element.prototype[name] = function (options, ...rest) {
+                return elementScroll.call(this, instant(options), ...rest);
+            };
+        }
+    }
+
+    if (settings.timer_factor < 1) {
+        const setTimeout = window.setTimeout;
+        // Kept for waits that must not be shortened
+        Object.defineProperty(window, '__priceWatcherSetTimeout', { value: setTimeout });
+        window.setTimeout = function (handler, delay, ...args) {
+            if (typeof delay === 'number' && delay > 0 && delay <= settings.timer_max_ms) {
+                delay = Math.round(delay * settings.timer_factor);
+            }
+            return setTimeout.call(this, handler, delay, ...args);
+        };
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        if (window.jQuery && window.jQuery.fx) {
+            window.jQuery.fx.off = true;
+        }
+    });
+}
+"""
+
+
+def turbo_settings(domain_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the turbo settings of a domain, or None if turbo mode is off"""
+    settings = domain_config.get('turbo')
+    if not settings:
+        return None
+    merged = dict(DEFAULT_TURBO_SETTINGS)
+    if isinstance(settings, dict):
+        merged.update(settings)
+    if not merged['enabled']:
+        return None
+    return merged
+
+
+async def install(context, settings: Dict[str, Any]):
+    """Add the turbo init script to a browser context"""
+    script_settings = {
+        'timer_factor': float(settings['timer_factor']),
+        'timer_max_ms': float(settings['timer_max_ms'])
+    }
+    await context.add_init_script(f"({TURBO_INIT_SCRIPT})({json.dumps(script_settings)});")
+
+
+def set_delay_factor(factor: float):
+    """Scale the delays of `pause` for the current run, returns a token for `reset_delay_factor`"""
+    return _delay_factor.set(factor)
+
+
+def reset_delay_factor(token):
+    _delay_factor.reset(token)
+
+
+def delay_factor() -> float:
+    return _delay_factor.get()
+
+
+async def pause(seconds: float):
+    """Sleep after a page action, shorter when the current run uses turbo mode"""
+    await asyncio.sleep(seconds * _delay_factor.get())
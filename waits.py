@@ -0,0 +1,182 @@
+from typing import Dict, Any, Optional
+from contextvars import ContextVar
+from playwright.async_api import Error as PlaywrightError
+import asyncio
+import time
+import turbo_mode
+import deadline
+
+# Defaults for the `waits` section of a domain config
+DEFAULT_WAIT_SETTINGS = {
+    'legacy': False,  # Use the old fixed sleeps instead of waiting for the page
+    'timeout': 3000,  # Maximum wait after an action in ms, a step can override it with `wait_timeout`
+    'quiet_ms': 150   # How long the DOM and the network must be quiet before an action counts as settled
+}
+
+# Wait settings of the run executing in the current task
+_settings: ContextVar[Dict[str, Any]] = ContextVar('wait_settings', default=DEFAULT_WAIT_SETTINGS)
+
+# Requests that the page makes in reaction to an action
+TRACKED_RESOURCE_TYPES = ('fetch', 'xhr', 'document')
+
+# Resolves once no mutation happened in `root` for `quiet` ms, or after `timeout` ms.
+# Turbo mode shortens page timers, so the original setTimeout is used when it is saved.
+DOM_QUIET_SCRIPT = """
+([root, quiet, timeout]) => new Promise(resolve => {
+    const setTimer = window.__priceWatcherSetTimeout || window.setTimeout;
+    const target = (root && root.isConnected && (root.closest('form') || root.parentElement)) || document.body || document.documentElement;
+    let timer = null;
+    let limit = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimer(done, quiet);
+    });
+    function done() {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(limit);
+        resolve();
+    }
+    observer.observe(target, { subtree: true, childList: true, attributes: true, characterData: true });
+    timer = setTimer(done, quiet);
+    limit = setTimer(done, timeout);
+})
+"""
+
+
+def wait_settings(domain_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the wait settings of a domain merged with the defaults"""
+    merged = dict(DEFAULT_WAIT_SETTINGS)
+    merged.update(domain_config.get('waits') or {})
+    return merged
+
+
+def set_settings(settings: Dict[str, Any]):
+    """Use these wait settings for the current run, returns a token for `reset_settings`"""
+    return _settings.set(settings)
+
+
+def reset_settings(token):
+    _settings.reset(token)
+
+
+def is_legacy(step: Dict[str, Any] = None) -> bool:
+    if step and 'legacy_waits' in step:
+        return bool(step['legacy_waits'])
+    return bool(_settings.get()['legacy'])
+
+
+def step_timeout(step: Dict[str, Any] = None) -> float:
+    """Maximum wait in ms for a step, never longer than the time left for the calculation"""
+    if step and step.get('wait_timeout') is not None:
+        return deadline.timeout(float(step['wait_timeout']))
+    return deadline.timeout(float(_settings.get()['timeout']))
+
+
+def typing_delay(step: Dict[str, Any] = None) -> int:
+    """Delay between key presses in ms, legacy configs type like a person"""
+    return 50 if is_legacy(step) else 0
+
+
+class RequestTracker:
+    """Counts the requests of a page that are still running"""
+
+    def __init__(self, page):
+        self.in_flight = set()
+        self.last_activity = time.monotonic()
+        page.on('request', self._started)
+        page.on('requestfinished', self._finished)
+        page.on('requestfailed', self._finished)
+
+    def _started(self, request):
+        if request.resource_type in TRACKED_RESOURCE_TYPES:
+            self.in_flight.add(request)
+            self.last_activity = time.monotonic()
+
+    def _finished(self, request):
+        if request in self.in_flight:
+            self.in_flight.discard(request)
+            self.last_activity = time.monotonic()
+
+    async def idle(self, quiet: float, timeout: float) -> bool:
+        """Wait until no request ran for `quiet` seconds, False after `timeout` seconds"""
+        start = time.monotonic()
+        while time.monotonic() - start < timeout:
+            since = max(self.last_activity, start)
+            if not self.in_flight and time.monotonic() - since >= quiet:
+                return True
+            await asyncio.sleep(0.05)
+        return False
+
+
+_trackers: Dict[Any, RequestTracker] = {}
+
+
+def track_requests(page):
+    """Start counting the requests of a page, call this before the first action"""
+    if page not in _trackers:
+        _trackers[page] = RequestTracker(page)
+        page.on('close', lambda _: _trackers.pop(page, None))
+
+
+async def _ignore_timeout(awaitable):
+    try:
+        await awaitable
+    except (PlaywrightError, asyncio.TimeoutError):
+        # The wait is an upper bound, the next action or read decides if the step worked
+        pass
+
+
+async def legacy_pause(step: Dict[str, Any] = None, seconds: float = 0.2):
+    """Sleep only for legacy configs, for actions the page handles synchronously"""
+    if is_legacy(step):
+        await turbo_mode.pause(seconds)
+
+
+async def actionable(element, step: Dict[str, Any] = None, legacy_delay: float = 0.5):
+    """Wait until an element stopped moving, e.g. after scrolling it into view"""
+    if is_legacy(step):
+        await turbo_mode.pause(legacy_delay)
+        return
+    await _ignore_timeout(element.wait_for_element_state('stable', timeout=step_timeout(step)))
+
+
+async def condition(frame, expression: str, arg: Any = None, step: Dict[str, Any] = None, legacy_delay: float = 1.0):
+    """Wait until a JavaScript condition is true in a page or frame"""
+    if is_legacy(step):
+        await turbo_mode.pause(legacy_delay)
+        return
+    await _ignore_timeout(frame.wait_for_function(expression, arg=arg, timeout=step_timeout(step)))
+
+
+async def settled(page, step: Dict[str, Any] = None, legacy_delay: float = 0.5, element=None, value: Optional[str] = None,
+                  quiet_ms: float = None):
+    """Wait until the page has processed an action.
+
+    Waits for the value of `element` to be committed when a value is given, then until
+    the DOM around the element and the requests of the page have been quiet for a while.
+    Returns early when everything is quiet and never waits longer than the step timeout.
+    Use a longer `quiet_ms` after actions that the page performs with a delay.
+    """
+    if is_legacy(step):
+        await turbo_mode.pause(legacy_delay)
+        return
+
+    timeout = step_timeout(step)
+    quiet = float(quiet_ms if quiet_ms is not None else _settings.get()['quiet_ms'])
+    start = time.monotonic()
+
+    if element is not None and value is not None:
+        await _ignore_timeout(page.wait_for_function(
+            # The rule of input_strategy.value_matches, sites may format the value, e.g. "1000 mm"
+            '([el, value]) => !el.isConnected || String(el.value) === value || String(el.value).includes(value)',
+            arg=[element, str(value)],
+            timeout=timeout
+        ))
+
+    remaining = max(quiet, timeout - (time.monotonic() - start) * 1000)
+    waits = [_ignore_timeout(page.evaluate(DOM_QUIET_SCRIPT, [element, quiet, remaining]))]
+    tracker = _trackers.get(page)
+    if tracker:
+        waits.append(tracker.idle(quiet / 1000, remaining / 1000))
+    await asyncio.gather(*waits)
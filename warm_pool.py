@@ -0,0 +1,176 @@
+from typing import Dict, Any, Optional, List, Callable, Awaitable
+from contextlib import AsyncExitStack
+from collections import deque
+import asyncio
+import contextvars
+import logging
+import math
+import time
+
+# Defaults for the `warm_pool` section of a domain config
+DEFAULT_WARM_SETTINGS = {
+    'enabled': True,
+    'size': 1,          # Pages kept ready per URL under normal load
+    'min_size': 0,      # Pages kept ready when the domain has been idle
+    'max_size': 4,      # Upper bound when the request rate goes up
+    'max_age': 300,     # Seconds before a pre-loaded page is considered stale
+    'rate_window': 300  # Seconds of request history used to adapt the size
+}
+
+
+class WarmPage:
+    """A pre-loaded page that is handed out exactly once"""
+
+    def __init__(self, url: str, page, stack: AsyncExitStack):
+        self.url = url
+        self.page = page
+        self._stack = stack
+        self.created_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return round(time.monotonic() - self.created_at, 2)
+
+    def is_usable(self, max_age: float) -> bool:
+        return not self.page.is_closed() and self.age <= max_age
+
+    async def close(self):
+        try:
+            await self._stack.aclose()
+        except Exception as e:
+            logging.warning(f"Error closing warm page for {self.url}: {str(e)}")
+
+
+class WarmPagePool:
+    """Keeps browser contexts per product URL that are already navigated and loaded.
+
+    A calculation takes a ready page and the pool refills it in the background. The
+    number of pages kept per URL follows the `warm_pool` settings of the domain config
+    and grows or shrinks with the recent request rate of the domain.
+    """
+
+    def __init__(self):
+        self._pages: Dict[str, List[WarmPage]] = {}
+        self._filling: Dict[str, int] = {}
+        self._requests: Dict[str, deque] = {}
+        self._fill_times: Dict[str, deque] = {}
+        self._tasks = set()
+        self._hits = 0
+        self._misses = 0
+
+    def _settings(self, domain_config: Dict[str, Any]) -> Dict[str, Any]:
+        settings = dict(DEFAULT_WARM_SETTINGS)
+        settings.update(domain_config.get('warm_pool') or {})
+        return settings
+
+    def _record_request(self, domain: str, window: float) -> int:
+        """Remember a request for the domain and return the number of requests in the window"""
+        now = time.monotonic()
+        requests = self._requests.setdefault(domain, deque())
+        requests.append(now)
+        while requests and now - requests[0] > window:
+            requests.popleft()
+        return len(requests)
+
+    def target_size(self, domain: str, settings: Dict[str, Any]) -> int:
+        """Number of pages to keep ready, based on the request rate and the time a refill takes"""
+        window = float(settings['rate_window'])
+        now = time.monotonic()
+        recent = [t for t in self._requests.get(domain, ()) if now - t <= window]
+        if not recent:
+            return int(settings['min_size'])
+
+        # Pages needed to cover the requests that arrive while a page is being refilled
+        fill_times = self._fill_times.get(domain)
+        fill_time = sum(fill_times) / len(fill_times) if fill_times else 5.0
+        demand = math.ceil(len(recent) / window * fill_time)
+
+        target = max(int(settings['size']), demand)
+        return max(int(settings['min_size']), min(int(settings['max_size']), target))
+
+    def take(self, domain: str, url: str, domain_config: Dict[str, Any], open_page: Callable[..., Awaitable]) -> Optional[WarmPage]:
+        """Take a ready page for the URL, if any, and schedule refills in the background.
+
+        `open_page(stack, url, domain_config, report_status=False)` must open and load a
+        page whose context is closed together with `stack`.
+        """
+        settings = self._settings(domain_config)
+        self._record_request(domain, float(settings['rate_window']))
+
+        warm_page = None
+        pages = self._pages.setdefault(url, [])
+        while pages:
+            candidate = pages.pop(0)
+            if candidate.is_usable(float(settings['max_age'])):
+                warm_page = candidate
+                break
+            self._spawn(candidate.close())
+
+        if warm_page:
+            self._hits += 1
+        else:
+            self._misses += 1
+
+        self._refill(domain, url, domain_config, settings, open_page)
+        return warm_page
+
+    def _refill(self, domain: str, url: str, domain_config: Dict[str, Any], settings: Dict[str, Any], open_page: Callable[..., Awaitable]):
+        missing = self.target_size(domain, settings) - len(self._pages.get(url, [])) - self._filling.get(url, 0)
+        for _ in range(max(0, missing)):
+            self._filling[url] = self._filling.get(url, 0) + 1
+            self._spawn(self._fill(domain, url, domain_config, open_page))
+
+    async def _fill(self, domain: str, url: str, domain_config: Dict[str, Any], open_page: Callable[..., Awaitable]):
+        stack = AsyncExitStack()
+        started = time.monotonic()
+        try:
+            page = await open_page(stack, url, domain_config, report_status=False)
+            self._fill_times.setdefault(domain, deque(maxlen=20)).append(time.monotonic() - started)
+            self._pages.setdefault(url, []).append(WarmPage(url, page, stack))
+            logging.info(f"Pre-loaded page ready for {url}")
+        except asyncio.CancelledError:
+            await stack.aclose()
+            raise
+        except Exception as e:
+            logging.warning(f"Could not pre-load page for {url}: {str(e)}")
+            await stack.aclose()
+        finally:
+            self._filling[url] -= 1
+
+    def _spawn(self, coro):
+        # Run outside the context of the request that triggered the refill, so its deadline,
+        # timings and run settings do not apply to the pre-loaded page
+        task = contextvars.Context().run(asyncio.create_task, coro)
+        # Keep a reference so background tasks are not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def warm_up(self, domain: str, url: str, domain_config: Dict[str, Any], open_page: Callable[..., Awaitable]):
+        """Start filling the pool for a URL up to its configured size without counting a request"""
+        settings = self._settings(domain_config)
+        missing = int(settings['size']) - len(self._pages.get(url, [])) - self._filling.get(url, 0)
+        for _ in range(max(0, missing)):
+            self._filling[url] = self._filling.get(url, 0) + 1
+            self._spawn(self._fill(domain, url, domain_config, open_page))
+
+    async def close(self):
+        """Close all pre-loaded pages"""
+        for task in list(self._tasks):
+            task.cancel()
+        pages = [page for url_pages in self._pages.values() for page in url_pages]
+        self._pages = {}
+        for page in pages:
+            await page.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return warm pool statistics"""
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "ready": {url: len(pages) for url, pages in self._pages.items()},
+            "filling": {url: count for url, count in self._filling.items() if count},
+            "avg_fill_seconds": {
+                domain: round(sum(times) / len(times), 2)
+                for domain, times in self._fill_times.items() if times
+            }
+        }